@@ -0,0 +1,126 @@
+"""
+EvidenceLab HTTP API - Headless classify and streaming answer endpoints
+
+Run with:
+    RATE_LIMIT_PROCESSES=3 uvicorn api:app --host 0.0.0.0 --port 8000 --workers 2
+
+Each worker, and the Streamlit app, has its own rate limiter. Set
+RATE_LIMIT_PROCESSES to their total (here two workers plus the app, in both
+environments) so together they stay within RATE_LIMIT_REQUESTS_PER_MINUTE.
+
+Endpoints:
+    GET  /health
+    POST /classify   {"question": "..."}
+    POST /answer     {"question": "...", "query_type": optional, "history": [...], "session": optional, "stream": true}
+    GET  /metrics    Prometheus text
+"""
+import json
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional, get_args
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from config import APP_NAME, PERPLEXITY_API_KEY
+from utils.query_classifier import QueryType, classify_query
+from utils.async_client import get_async_client
+from utils.prompts import MEDICAL_DISCLAIMER
+from utils.conversation import carry_compounds
+from utils.scheduler import request_class
+from utils.metrics import metrics
+
+QUERY_TYPES = get_args(QueryType)
+
+
+class ClassifyRequest(BaseModel):
+    question: str = Field(min_length=1, max_length=2000)
+
+
+class Message(BaseModel):
+    role: Literal["user", "assistant"]
+    content: str
+    metadata: dict = {}
+
+
+class AnswerRequest(ClassifyRequest):
+    query_type: Optional[str] = None
+    history: List[Message] = []  # Earlier turns, oldest first; trimmed to the history token budget
+    session: Optional[str] = Field(default=None, max_length=128)  # Fair-queuing key; defaults to the caller's address
+    stream: bool = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled async client per worker process, shared by every connection
+    app.state.client = get_async_client() if PERPLEXITY_API_KEY else None
+    yield
+    if app.state.client:
+        await app.state.client.aclose()
+
+
+app = FastAPI(title=f"{APP_NAME} API", lifespan=lifespan)
+
+
+def classify(question: str, query_type: Optional[str] = None) -> dict:
+    with metrics.timer("stage_seconds", stage="classify"):
+        detected_type, compounds, confidence = classify_query(question)
+    if query_type is not None and query_type not in QUERY_TYPES:
+        raise HTTPException(status_code=422, detail=f"Unknown query_type '{query_type}'")
+    return {"query_type": query_type or detected_type, "compounds": compounds, "confidence": confidence}
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "upstream_configured": app.state.client is not None}
+
+
+@app.post("/classify")
+async def classify_endpoint(request: ClassifyRequest):
+    return classify(request.question)
+
+
+@app.post("/answer")
+async def answer_endpoint(request: AnswerRequest, http_request: Request):
+    client = app.state.client
+    if client is None:
+        raise HTTPException(status_code=503, detail="PERPLEXITY_API_KEY not set.")
+    history = [message.model_dump() for message in request.history]
+    classification = classify(request.question, request.query_type)
+    classification["compounds"] = carry_compounds(classification["compounds"], history)
+    session = request.session or (http_request.client.host if http_request.client else None)
+
+    if not request.stream:
+        try:
+            with request_class("chat", session):
+                result = await client.aanswer(request.question, classification["query_type"], classification["compounds"], history)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
+        return {**classification, **result, "disclaimer": MEDICAL_DISCLAIMER.strip()}
+
+    async def events():
+        yield sse("classification", classification)
+        try:
+            with request_class("chat", session):
+                async for kind, value in client.astream_events(
+                    request.question, classification["query_type"], classification["compounds"], history
+                ):
+                    if kind == "content":
+                        yield sse("delta", {"text": value})
+                    else:
+                        yield sse("done", {"citations": value, "disclaimer": MEDICAL_DISCLAIMER.strip()})
+        except Exception as e:
+            yield sse("error", {"message": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return metrics.render_prometheus()
@@ -3,10 +3,20 @@ EvidenceLab - Evidence-Based Peptide & HRT Research Assistant
 """
 import streamlit as st
 import os
-from config import APP_NAME, APP_DESCRIPTION, COMPOUND_CATEGORIES, RESPONSE_TARGETS
+import uuid
+from config import (
+    APP_NAME, APP_DESCRIPTION, COMPOUND_CATEGORIES, RESPONSE_TARGETS, QUICK_LOOKUP_BUTTONS,
+    SESSION_WINDOW_MESSAGES, SESSION_PAGE_SIZE
+)
 from utils.query_classifier import classify_query, get_query_context
-from utils.perplexity_client import PerplexityClient
+from utils.perplexity_client import get_client
 from utils.prompts import MEDICAL_DISCLAIMER
+from utils.stream_renderer import StreamRenderer
+from utils.conversation import carry_compounds
+from utils.metrics import metrics, start_exporters
+from utils.warmup import start_warmup
+from utils.session_store import get_session_store
+from utils.scheduler import request_class
 
 st.set_page_config(page_title=APP_NAME, page_icon="🧬", layout="wide", initial_sidebar_state="collapsed")
 
@@ -48,17 +58,42 @@ def get_api_key():
     return os.getenv("PERPLEXITY_API_KEY")
 
 
+@st.cache_resource
+def start_metrics():
+    """Start the configured metrics exporters once per server process."""
+    start_exporters()
+
+
+@st.cache_resource
+def get_shared_client(api_key):
+    """One pooled client per API key, shared by every browser session."""
+    return get_client(api_key)
+
+
+@st.cache_resource
+def start_cache_warmup(api_key):
+    """Pin the warmed Quick Lookup answers and keep them fresh, once per server process."""
+    client = get_shared_client(api_key)
+    if client.cache is not None:
+        start_warmup(client, client.cache)
+
+
 def init_session_state():
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    if "session_id" not in st.session_state:
+        # The id lives in the URL so a reload resumes the stored transcript
+        session_id = st.query_params.get("session") or uuid.uuid4().hex
+        st.query_params["session"] = session_id
+        st.session_state.session_id = session_id
+        st.session_state.messages = get_session_store().page(session_id, limit=SESSION_WINDOW_MESSAGES)
     if "pending_query" not in st.session_state:
         st.session_state.pending_query = None
     if "perplexity_client" not in st.session_state:
         api_key = get_api_key()
         if api_key:
             try:
-                st.session_state.perplexity_client = PerplexityClient(api_key)
+                st.session_state.perplexity_client = get_shared_client(api_key)
                 st.session_state.api_key_set = True
+                start_cache_warmup(api_key)
             except Exception:
                 st.session_state.perplexity_client = None
                 st.session_state.api_key_set = False
@@ -67,6 +102,27 @@ def init_session_state():
             st.session_state.api_key_set = False
 
 
+def add_message(message):
+    """Persist a message and keep only the most recent window in session state."""
+    message["seq"] = get_session_store().append(st.session_state.session_id, message)
+    st.session_state.messages.append(message)
+    del st.session_state.messages[:-SESSION_WINDOW_MESSAGES]
+
+
+def render_earlier_messages():
+    """Page through messages older than the in-memory window, loading only the page shown."""
+    window = st.session_state.messages
+    older = window[0]["seq"] if window else 0
+    if not older or not st.toggle(f"🕘 Show {older} earlier messages"):
+        return
+    pages = -(-older // SESSION_PAGE_SIZE)
+    page = st.number_input("Page", min_value=1, max_value=pages, value=pages) if pages > 1 else 1
+    end = min(page * SESSION_PAGE_SIZE, older)
+    for message in get_session_store().page(st.session_state.session_id, before=end, limit=end - (page - 1) * SESSION_PAGE_SIZE):
+        render_message(message)
+    st.divider()
+
+
 def render_message(message):
     with st.chat_message(message["role"]):
         if message["role"] == "assistant" and "metadata" in message:
@@ -75,27 +131,34 @@ def render_message(message):
         st.markdown(message["content"])
 
 
-def generate_response(prompt):
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    query_type, compounds, confidence = classify_query(prompt)
+def generate_response(prompt, standalone=False):
+    # Quick Lookup questions are standalone so they hit the warmed cache whatever the chat holds
+    history = [] if standalone else st.session_state.messages[:]
+    add_message({"role": "user", "content": prompt})
+    with metrics.timer("stage_seconds", stage="classify"):
+        query_type, compounds, confidence = classify_query(prompt)
+    # Follow-ups like "what about side effects?" keep the compounds already under discussion
+    compounds = carry_compounds(compounds, history)
     
     with st.chat_message("assistant"):
         st.caption(f"📝 {query_type.title()} | 🧪 {', '.join(compounds) if compounds else 'General'}")
-        message_placeholder = st.empty()
-        full_response = ""
-        try:
-            for chunk in st.session_state.perplexity_client.stream_query(user_message=prompt, query_type=query_type, compounds=compounds):
-                full_response += chunk
-                message_placeholder.markdown(full_response + "▌")
-            message_placeholder.markdown(full_response)
-        except Exception as e:
-            full_response = f"❌ Error: {str(e)}"
-            message_placeholder.markdown(full_response)
+        renderer = StreamRenderer(st.empty())
+        with metrics.timer("stage_seconds", stage="request", query_type=query_type):
+            try:
+                # Quick Lookup clicks are scheduled ahead of free-form chat; sessions take turns within each
+                with request_class("interactive" if standalone else "chat", st.session_state.session_id):
+                    for chunk in st.session_state.perplexity_client.stream_query(user_message=prompt, query_type=query_type, compounds=compounds, conversation_history=history):
+                        renderer.append(chunk)
+                full_response = renderer.finish()
+            except Exception as e:
+                full_response = renderer.finish(f"❌ Error: {str(e)}")
+        metrics.observe("stage_seconds", renderer.render_seconds, stage="render", query_type=query_type)
     
-    st.session_state.messages.append({"role": "assistant", "content": full_response, "metadata": {"query_type": query_type, "compounds": compounds}})
+    add_message({"role": "assistant", "content": full_response, "metadata": {"query_type": query_type, "compounds": compounds}})
 
 
 def main():
+    start_metrics()
     init_session_state()
     
     st.title("🧬 EvidenceLab")
@@ -114,37 +177,23 @@ def main():
         with col_comp:
             compound = st.selectbox("Compound", options=COMPOUND_CATEGORIES[category])
         
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            if st.button("📋 TLDR", use_container_width=True):
-                st.session_state.pending_query = f"Give me the TLDR on {compound}"
-        with col2:
-            if st.button("📊 Overview", use_container_width=True):
-                st.session_state.pending_query = f"What is {compound}?"
-        with col3:
-            if st.button("💉 Dosage", use_container_width=True):
-                st.session_state.pending_query = f"What's the dosage for {compound}?"
-        
-        col4, col5, col6 = st.columns(3)
-        with col4:
-            if st.button("⏱️ Timeline", use_container_width=True):
-                st.session_state.pending_query = f"When will I see results from {compound}?"
-        with col5:
-            if st.button("✅ Benefits", use_container_width=True):
-                st.session_state.pending_query = f"What are the benefits of {compound}?"
-        with col6:
-            if st.button("⚠️ Side Effects", use_container_width=True):
-                st.session_state.pending_query = f"What are the side effects of {compound}?"
+        for row in range(0, len(QUICK_LOOKUP_BUTTONS), 3):
+            for column, (label, template) in zip(st.columns(3), QUICK_LOOKUP_BUTTONS[row:row + 3]):
+                with column:
+                    if st.button(label, use_container_width=True):
+                        st.session_state.pending_query = template.format(compound=compound)
     
     # Clear chat button
     if st.session_state.messages:
         if st.button("🗑️ Clear Chat"):
+            get_session_store().clear(st.session_state.session_id)
             st.session_state.messages = []
             st.rerun()
     
     st.divider()
     
-    # Display chat history
+    # Display chat history: older pages on demand, then the recent window
+    render_earlier_messages()
     for message in st.session_state.messages:
         render_message(message)
     
@@ -152,7 +201,7 @@ def main():
     if st.session_state.pending_query:
         prompt = st.session_state.pending_query
         st.session_state.pending_query = None
-        generate_response(prompt)
+        generate_response(prompt, standalone=True)
         st.rerun()
     
     # Chat input
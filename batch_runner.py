@@ -0,0 +1,203 @@
+"""
+EvidenceLab Batch Runner - Answer a JSONL file of questions with bounded concurrency
+
+Usage:
+    python batch_runner.py questions.jsonl answers.jsonl --concurrency 8
+
+Each input line is a JSON object with a "question" field and optional "id" and
+"query_type" fields. Each output line records the classification, answer,
+citations, timings and any error. The output file doubles as the checkpoint:
+re-running with the same output path skips questions that already have an
+answer, so an interrupted run never repeats a paid call. With --retry-errors a
+failed question is appended again; the last line for an id is the current one.
+Lines that are not valid JSON or have no question are reported and skipped.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from utils.query_classifier import classify_query
+from utils.perplexity_client import get_client
+from utils.scheduler import get_scheduler, request_class
+from utils.metrics import metrics
+
+
+def question_id(record):
+    """Stable id for an input record: its own id, else a hash of the question."""
+    if record.get("id") is not None:
+        return str(record["id"])
+    raw = f"{record.get('query_type') or ''}|{record['question']}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def read_questions(path, on_invalid=None):
+    """
+    Yield input records, skipping blank lines. An invalid line is passed to
+    on_invalid as a message and skipped, or raises ValueError without one.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if isinstance(record, str):
+                    record = {"question": record}
+                if not isinstance(record, dict) or not record.get("question"):
+                    raise ValueError("missing 'question'")
+            except ValueError as e:  # Includes json.JSONDecodeError
+                if on_invalid is None:
+                    raise ValueError(f"{path}:{line_no}: {e}") from None
+                on_invalid(f"{path}:{line_no}: {e}")
+                continue
+            record["id"] = question_id(record)
+            yield record
+
+
+def load_checkpoint(path, retry_errors=False):
+    """Ids already answered in a previous run of the same output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial line from an interrupted write
+            if retry_errors and result.get("error"):
+                continue
+            done.add(result["id"])
+    return done
+
+
+def run_question(client, record):
+    """Classify and answer one question, capturing timings and errors."""
+    started = time.perf_counter()
+    detected_type, compounds, confidence = classify_query(record["question"])
+    query_type = record.get("query_type") or detected_type
+    classified = time.perf_counter()
+    metrics.observe("stage_seconds", classified - started, stage="classify")
+
+    result = {
+        "id": record["id"],
+        "question": record["question"],
+        "query_type": query_type,
+        "compounds": compounds,
+        "confidence": confidence,
+        "answer": None,
+        "citations": [],
+        "error": None,
+        "timings": {"classify_ms": round((classified - started) * 1000, 2)},
+    }
+
+    parts = []
+    first_chunk = None
+    try:
+        # Batch calls yield to interactive users sharing the process's upstream slots
+        with request_class("background", "batch"):
+            stream = client.stream_answer(record["question"], query_type=query_type, compounds=compounds)
+            while True:
+                try:
+                    parts.append(next(stream))
+                except StopIteration as stop:
+                    result["citations"] = stop.value or []
+                    break
+                if first_chunk is None:
+                    first_chunk = time.perf_counter()
+        result["answer"] = "".join(parts)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    finished = time.perf_counter()
+    if first_chunk is not None:
+        result["timings"]["first_chunk_ms"] = round((first_chunk - classified) * 1000, 2)
+    result["timings"]["total_ms"] = round((finished - started) * 1000, 2)
+    return result
+
+
+def run_batch(input_path, output_path, concurrency=8, retry_errors=False, client=None):
+    """Answer every pending question, appending results to output_path as they finish."""
+    client = client or get_client()
+    if client.scheduler is not None:
+        # More workers than background slots would only queue inside the scheduler
+        concurrency = min(concurrency, client.scheduler.capacity("background"))
+    done = load_checkpoint(output_path, retry_errors)
+    counts = {"answered": 0, "errors": 0, "skipped": 0, "invalid": 0}
+
+    def report_invalid(message):
+        counts["invalid"] += 1
+        print(f"Skipping invalid line {message}", file=sys.stderr)
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+
+        def write(futures):
+            # A future leaves in_flight only once its line is on disk, so nothing is lost if interrupted here
+            for future in futures:
+                result = future.result()
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+                in_flight.discard(future)
+                counts["errors" if result["error"] else "answered"] += 1
+
+        try:
+            for record in read_questions(input_path, on_invalid=report_invalid):
+                if record["id"] in done:
+                    counts["skipped"] += 1
+                    continue
+                done.add(record["id"])
+                # Keep at most `concurrency` calls in flight; write each as soon as it lands
+                if len(in_flight) >= concurrency:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    write(finished)
+                in_flight.add(pool.submit(run_question, client, record))
+            finished, _ = wait(in_flight)
+            write(finished)
+        except BaseException:
+            # Interrupted or failed: let paid calls already in flight land in the checkpoint first
+            for future in in_flight:
+                future.cancel()
+            finished, _ = wait(in_flight)
+            write([f for f in finished if not f.cancelled()])
+            raise
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with EvidenceLab.")
+    parser.add_argument("input", help="JSONL file with one {\"question\": ...} per line")
+    parser.add_argument("output", help="JSONL file for results; also used to resume")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum upstream calls in flight, up to SCHEDULER_MAX_IN_FLIGHT")
+    parser.add_argument("--retry-errors", action="store_true", help="Re-run questions that failed last time")
+    parser.add_argument("--metrics-out", help="Write a JSON snapshot of latency metrics here when done")
+    args = parser.parse_args(argv)
+
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        scheduler.reserved = 0  # This process serves no interactive users to keep slots for
+    started = time.perf_counter()
+    try:
+        counts = run_batch(args.input, args.output, args.concurrency, args.retry_errors)
+    except KeyboardInterrupt:
+        print("Interrupted; re-run the same command to resume.", file=sys.stderr)
+        return 130
+    elapsed = time.perf_counter() - started
+    if args.metrics_out:
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            json.dump(metrics.snapshot(), f, indent=2)
+    print(
+        f"Answered {counts['answered']}, errors {counts['errors']}, "
+        f"skipped {counts['skipped']} already done, {counts['invalid']} invalid lines, in {elapsed:.1f}s",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
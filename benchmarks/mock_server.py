@@ -0,0 +1,165 @@
+"""
+Mock Perplexity Server - Local stand-in for the chat/completions endpoint
+
+Usage:
+    python -m benchmarks.mock_server --port 8787 --latency 0.3 --tokens-per-second 80
+
+Point the app or any client at it with PERPLEXITY_BASE_URL=http://127.0.0.1:8787
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "Peptide research suggests typical protocols vary widely. Individual response depends on dose "
+    "timing and baseline health markers. Discuss any plan with a qualified healthcare provider."
+).split()
+
+
+class MockSettings:
+    """Behaviour knobs for the mock endpoint."""
+
+    def __init__(self, latency=0.2, tokens_per_second=100.0, answer_words=120, citations=5,
+                 error_rate=0.0, error_status=503, seed=None, slow_rate=0.0, slow_latency=5.0):
+        self.latency = latency  # Seconds before the first byte
+        self.tokens_per_second = tokens_per_second  # Streaming rate; 0 sends everything at once
+        self.answer_words = answer_words
+        self.citations = citations
+        self.error_rate = error_rate  # Fraction of requests answered with error_status
+        self.error_status = error_status
+        self.slow_rate = slow_rate  # Fraction of requests that wait slow_latency instead (tail latency)
+        self.slow_latency = slow_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def next_outcome(self):
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def next_latency(self):
+        with self.lock:
+            slow = self.random.random() < self.slow_rate
+        return self.slow_latency if slow else self.latency
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Serves chat/completions using the settings attached to its server."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        settings = self.server.settings
+        if self.path.rstrip("/") != "/chat/completions":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        time.sleep(settings.next_latency())
+        if settings.next_outcome():
+            body = json.dumps({"error": {"message": "injected failure"}}).encode("utf-8")
+            self.send_response(settings.error_status)
+            if settings.error_status == 429:
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        words = [WORDS[i % len(WORDS)] for i in range(settings.answer_words)]
+        # One word per token is close enough to exercise max_tokens truncation
+        finish_reason = "stop"
+        if payload.get("max_tokens") and len(words) > payload["max_tokens"]:
+            words = words[:payload["max_tokens"]]
+            finish_reason = "length"
+        citations = [f"https://www.example{i}.org/study/{i}" for i in range(1, settings.citations + 1)]
+        if payload.get("stream"):
+            self._stream(words, citations, finish_reason)
+        else:
+            body = json.dumps({
+                "id": "mock", "model": payload.get("model"), "citations": citations,
+                "choices": [{"index": 0, "finish_reason": finish_reason,
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def _stream(self, words, citations, finish_reason="stop"):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        settings = self.server.settings
+        delay = 1.0 / settings.tokens_per_second if settings.tokens_per_second else 0.0
+        for i, word in enumerate(words):
+            event = {"id": "mock", "citations": citations,
+                     "choices": [{"index": 0, "delta": {"content": (" " if i else "") + word},
+                                  "finish_reason": finish_reason if i == len(words) - 1 else None}]}
+            self._chunk(f"data: {json.dumps(event)}\n\n")
+            if delay:
+                time.sleep(delay)
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # Clients closing pooled keep-alive connections is expected, not an error
+
+
+def start_mock_server(settings: MockSettings = None, host="127.0.0.1", port=0):
+    """Start the mock server on a daemon thread; returns (server, base_url)."""
+    settings = settings or MockSettings()
+    server = MockServer((host, port), MockHandler)
+    server.settings = settings
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock of the Perplexity chat/completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first byte")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--answer-words", type=int, default=120)
+    parser.add_argument("--citations", type=int, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(args.latency, args.tokens_per_second, args.answer_words, args.citations,
+                            args.error_rate, args.error_status, slow_rate=args.slow_rate,
+                            slow_latency=args.slow_latency)
+    server = MockServer((args.host, args.port), MockHandler)
+    server.settings = settings
+    print(f"Mock Perplexity API on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+EvidenceLab Benchmarks - Classifier microbenchmarks and end-to-end runs against a mock API
+
+Usage:
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.run --out new.json --compare bench.json
+
+Everything runs offline: end-to-end benchmarks start a local mock of the
+chat/completions endpoint, and the answer cache and rate limiter are disabled
+so every request reaches it.
+"""
+import os
+
+# Must be set before config is imported; PERPLEXITY_BASE_URL is set in main() once the mock is up
+os.environ.setdefault("PERPLEXITY_API_KEY", "benchmark")
+os.environ["ANSWER_CACHE_ENABLED"] = "false"
+os.environ["RATE_LIMIT_REQUESTS_PER_MINUTE"] = "0"
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.mock_server import MockSettings, start_mock_server
+
+QUESTION_TEMPLATES = [
+    "What is {c}?", "Give me the TLDR on {c}", "What's the dosage for {c}?",
+    "When will I see results from {c}?", "What are the benefits of {c}?",
+    "What are the side effects of {c}?", "Is {c} safe?", "{c} vs {d}",
+    "How to reconstitute {c}", "Does {c} actually work? Show me studies",
+    "how much {c} should i take per week", "compare {c} and {d} for recovery",
+    "tell me about peptides for sleep", "whats the best protocol for fat loss",
+]
+
+
+def build_corpus(size=5000, seed=7):
+    """Generate a reproducible mix of templated, lower-cased and compound-free questions."""
+    from config import COMPOUND_CATEGORIES
+
+    rng = random.Random(seed)
+    compounds = [c for category in COMPOUND_CATEGORIES.values() for c in category]
+    corpus = []
+    for _ in range(size):
+        question = rng.choice(QUESTION_TEMPLATES).format(c=rng.choice(compounds), d=rng.choice(compounds))
+        if rng.random() < 0.3:
+            question = question.lower().replace("-", rng.choice(["", " ", "-"]))
+        corpus.append(question)
+    return corpus
+
+
+def summarize(samples):
+    """Latency summary in milliseconds."""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+
+    def pct(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "n": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": pct(0.50),
+        "p90_ms": pct(0.90),
+        "p99_ms": pct(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def time_each(fn, items, repeat=3):
+    """Per-call latencies of fn over items, best total of `repeat` passes."""
+    best = None
+    for _ in range(repeat):
+        samples = []
+        for item in items:
+            started = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - started)
+        if best is None or sum(samples) < sum(best):
+            best = samples
+    return best
+
+
+def bench_classifier(corpus):
+    from utils.query_classifier import classify_query, classify_queries, extract_compounds
+
+    results = {
+        "classify_query": summarize(time_each(classify_query, corpus)),
+        "extract_compounds": summarize(time_each(extract_compounds, corpus)),
+    }
+    stats = {}
+    list(classify_queries(corpus * 4, stats=stats))
+    results["classify_queries"] = {
+        "n": stats["queries"],
+        "memo_hits": stats["memo_hits"],
+        "queries_per_second": stats["queries_per_second"],
+    }
+    return results
+
+
+def run_stream_query(client, question):
+    """Stream one answer; returns (ttfb, total, error)."""
+    from utils.query_classifier import classify_query
+
+    query_type, compounds, _ = classify_query(question)
+    started = time.perf_counter()
+    first = None
+    error = False
+    for chunk in client.stream_query(question, query_type=query_type, compounds=compounds):
+        if first is None:
+            first = time.perf_counter()
+        if chunk.startswith("\n\nError:"):
+            error = True
+    return (first or time.perf_counter()) - started, time.perf_counter() - started, error
+
+
+def bench_end_to_end(server, corpus, settings, requests_count, concurrency):
+    from utils.perplexity_client import PerplexityClient, ask_evidencelab
+
+    server.settings = settings
+    client = PerplexityClient(coalesce=False)
+    questions = corpus[:requests_count]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        outcomes = list(pool.map(lambda q: run_stream_query(client, q), questions))
+        wall = time.perf_counter() - started
+    client.close()
+
+    ask_samples = time_each(ask_evidencelab, questions[:10], repeat=1)
+
+    return {
+        "mock": {k: v for k, v in vars(settings).items() if k not in ("random", "lock")},
+        "concurrency": concurrency,
+        "stream_query_ttfb": summarize([o[0] for o in outcomes]),
+        "stream_query_total": summarize([o[1] for o in outcomes]),
+        "stream_query_errors": sum(o[2] for o in outcomes),
+        "requests_per_second": len(questions) / wall if wall else 0.0,
+        "ask_evidencelab": summarize(ask_samples),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline, path=()):
+    """Yield (metric path, baseline, current, ratio) for every numeric leaf both runs share."""
+    for key, value in current.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            yield from compare(value, other or {}, path + (key,))
+        elif isinstance(value, (int, float)) and isinstance(other, (int, float)) and other:
+            yield ".".join(path + (key,)), other, value, value / other
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run EvidenceLab benchmarks offline.")
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run to compare against")
+    parser.add_argument("--corpus-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--skip-e2e", action="store_true", help="Only run classifier microbenchmarks")
+    parser.add_argument("--requests", type=int, default=100, help="End-to-end requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock seconds before first byte")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--answer-words", type=int, default=120)
+    parser.add_argument("--citations", type=int, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_mock_server()
+    os.environ["PERPLEXITY_BASE_URL"] = base_url
+
+    corpus = build_corpus(args.corpus_size, args.seed)
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "classifier": bench_classifier(corpus),
+    }
+    if not args.skip_e2e:
+        settings = dict(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                        answer_words=args.answer_words, citations=args.citations, seed=args.seed)
+        report["end_to_end"] = {
+            "healthy": bench_end_to_end(server, corpus, MockSettings(**settings), args.requests, args.concurrency),
+            "errors": bench_end_to_end(server, corpus, MockSettings(error_rate=args.error_rate, **settings),
+                                       args.requests, args.concurrency),
+        }
+    server.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("classifier", "end_to_end"):
+            for name, before, after, ratio in compare(report.get(key, {}), baseline.get(key, {}), (key,)):
+                print(f"{name:70s} {before:12.3f} -> {after:12.3f}  ({ratio:.2f}x)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,9 +8,95 @@ load_dotenv()
 
 # API Configuration
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
-PERPLEXITY_BASE_URL = "https://api.perplexity.ai"
+PERPLEXITY_BASE_URL = os.getenv("PERPLEXITY_BASE_URL", "https://api.perplexity.ai")  # Override to point at a mock server
 PERPLEXITY_MODEL = "sonar-pro"  # Best for research queries with citations
 
+# HTTP connection pool (shared by every session in the process)
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))  # Distinct hosts kept pooled
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))  # Keep-alive connections per host
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "true").lower() == "true"  # Wait for a free connection instead of exceeding the limit
+
+# Upstream resilience
+PERPLEXITY_CONNECT_TIMEOUT = float(os.getenv("PERPLEXITY_CONNECT_TIMEOUT", "5"))  # Seconds to establish a connection
+PERPLEXITY_READ_TIMEOUT = float(os.getenv("PERPLEXITY_READ_TIMEOUT", "60"))  # Max silence between streamed bytes
+PERPLEXITY_MAX_RETRIES = int(os.getenv("PERPLEXITY_MAX_RETRIES", "3"))  # Retries before the first byte only
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.5"))  # Seconds; doubles per attempt
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "8"))  # Seconds; a longer Retry-After is not waited out
+RATE_LIMIT_REQUESTS_PER_MINUTE = float(os.getenv("RATE_LIMIT_REQUESTS_PER_MINUTE", "50"))  # Match the API tier; 0 disables
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_PROCESSES = int(os.getenv("RATE_LIMIT_PROCESSES", "1"))  # Processes sharing the quota (app + API workers); each gets an equal share
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))  # Fail instead of queueing longer than this
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"  # Duplicate requests whose first byte is late
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))  # Hedge after this quantile of recent time-to-first-byte
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # Per query type, before the adaptive delay is trusted
+HEDGE_INITIAL_DELAY = float(os.getenv("HEDGE_INITIAL_DELAY", "3"))  # Seconds, until enough samples exist
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.25"))
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.1"))  # Max fraction of recent requests that may be hedged
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))  # Recent samples kept per query type
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "60"))  # Rolling window of upstream outcomes
+BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", "10"))  # Outcomes needed in the window before tripping
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))  # Errors + slow calls that open the breaker
+BREAKER_SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "15"))  # Time to response headers counted as a slow call
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))  # Wait before letting a probe through
+
+# Upstream scheduler (priority classes: Quick Lookup > chat > warm-up and batch)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_MAX_IN_FLIGHT = int(os.getenv("SCHEDULER_MAX_IN_FLIGHT", "8"))  # Upstream requests in flight per process
+SCHEDULER_RESERVED_SLOTS = int(os.getenv("SCHEDULER_RESERVED_SLOTS", "2"))  # Kept free of warm-up and batch work
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "60"))  # Fail instead of queueing longer than this
+
+# Answer cache (in-memory LRU in front of an on-disk SQLite tier)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", ".cache/answers.sqlite3")  # Empty string disables the disk tier
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds
+ANSWER_CACHE_STALE_GRACE = int(os.getenv("ANSWER_CACHE_STALE_GRACE", str(30 * 24 * 3600)))  # Expired answers kept for outages
+ANSWER_CACHE_MEMORY_ENTRIES = int(os.getenv("ANSWER_CACHE_MEMORY_ENTRIES", "1000"))
+ANSWER_CACHE_DISK_ENTRIES = int(os.getenv("ANSWER_CACHE_DISK_ENTRIES", "50000"))
+SIMILAR_QUESTIONS_ENABLED = os.getenv("SIMILAR_QUESTIONS_ENABLED", "true").lower() == "true"  # Answer reworded questions from the cache
+SIMILAR_QUESTIONS_THRESHOLD = float(os.getenv("SIMILAR_QUESTIONS_THRESHOLD", "0.8"))  # Estimated Jaccard similarity of what is left after compounds and intent
+SIMILAR_QUESTIONS_MAX_ENTRIES = int(os.getenv("SIMILAR_QUESTIONS_MAX_ENTRIES", "1000000"))  # About 300 bytes each
+
+# Metrics export (in-process histograms; both exporters are off by default)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve Prometheus text at :PORT/metrics
+METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH", "")  # Append periodic snapshots here
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))  # Seconds between JSONL snapshots
+
+# Streaming render throttle for the chat UI
+RENDER_INTERVAL_SECONDS = float(os.getenv("RENDER_INTERVAL_SECONDS", "0.1"))  # Minimum time between frames
+RENDER_MAX_PENDING_CHARS = int(os.getenv("RENDER_MAX_PENDING_CHARS", "400"))  # Render early once this much new text is buffered
+
+# Answer length budgets derived from RESPONSE_TARGETS
+ANSWER_BUDGET_ENABLED = os.getenv("ANSWER_BUDGET_ENABLED", "true").lower() == "true"
+ANSWER_TOKENS_PER_WORD = float(os.getenv("ANSWER_TOKENS_PER_WORD", "1.6"))  # Includes markdown and citation markers
+ANSWER_SOFT_LIMIT_FACTOR = float(os.getenv("ANSWER_SOFT_LIMIT_FACTOR", "1.25"))  # Stop at the next sentence end past max words x this
+ANSWER_HARD_LIMIT_FACTOR = float(os.getenv("ANSWER_HARD_LIMIT_FACTOR", "1.6"))  # max_tokens sent upstream, as a multiple of max words
+
+# Conversation history resent with follow-up questions
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))  # Estimated tokens of prior turns per request; 0 disables
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))  # Question/answer pairs kept verbatim
+HISTORY_SUMMARY_TURNS = int(os.getenv("HISTORY_SUMMARY_TURNS", "5"))  # Older questions listed in a one-line summary
+HISTORY_CHARS_PER_TOKEN = float(os.getenv("HISTORY_CHARS_PER_TOKEN", "4"))
+
+# Comparison fan-out: per-compound profiles fetched concurrently, then merged
+COMPARISON_FANOUT_ENABLED = os.getenv("COMPARISON_FANOUT_ENABLED", "true").lower() == "true"
+COMPARISON_FANOUT_MAX_COMPOUNDS = int(os.getenv("COMPARISON_FANOUT_MAX_COMPOUNDS", "4"))  # More than this uses one prompt
+COMPARISON_MERGE_MODEL = os.getenv("COMPARISON_MERGE_MODEL", "sonar")  # Merge step only rewrites the profiles
+
+# Quick Lookup cache warm-up (pre-generates every compound x button answer)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "false").lower() == "true"  # Refresh in the app process; off spends no credits
+WARMUP_SNAPSHOT_PATH = os.getenv("WARMUP_SNAPSHOT_PATH", ".cache/quick_lookup.json")
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "2"))
+WARMUP_RATE_RESERVE = float(os.getenv("WARMUP_RATE_RESERVE", "5"))  # Limiter tokens left for interactive requests
+WARMUP_REFRESH_AHEAD = int(os.getenv("WARMUP_REFRESH_AHEAD", str(24 * 3600)))  # Regenerate entries this close to expiry
+WARMUP_INTERVAL = float(os.getenv("WARMUP_INTERVAL", "3600"))  # Seconds between background passes
+
+# Chat sessions (transcripts live in the store; only a recent window stays in memory)
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite")  # "sqlite" or "memory"
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", ".cache/sessions.sqlite3")
+SESSION_WINDOW_MESSAGES = int(os.getenv("SESSION_WINDOW_MESSAGES", "12"))  # Messages kept in session state and rendered live
+SESSION_PAGE_SIZE = int(os.getenv("SESSION_PAGE_SIZE", "20"))  # Older messages shown per history page
+
 # App Configuration
 APP_NAME = "EvidenceLab"
 APP_DESCRIPTION = "Evidence-based peptide & HRT research assistant"
@@ -27,8 +113,19 @@ RESPONSE_TARGETS = {
     "how_to": {"min": 80, "max": 120, "description": "Usage instructions"},
     "evidence": {"min": 75, "max": 100, "description": "Research quality"},
     "tldr": {"min": 150, "max": 200, "description": "Quick summary"},
+    "profile": {"min": 100, "max": 140, "description": "Per-compound profile for comparisons"},
 }
 
+# Quick Lookup buttons: (label, question template), rendered three per row
+QUICK_LOOKUP_BUTTONS = [
+    ("📋 TLDR", "Give me the TLDR on {compound}"),
+    ("📊 Overview", "What is {compound}?"),
+    ("💉 Dosage", "What's the dosage for {compound}?"),
+    ("⏱️ Timeline", "When will I see results from {compound}?"),
+    ("✅ Benefits", "What are the benefits of {compound}?"),
+    ("⚠️ Side Effects", "What are the side effects of {compound}?"),
+]
+
 # Compound categories
 COMPOUND_CATEGORIES = {
     "peptides": [
@@ -49,3 +146,39 @@ COMPOUND_CATEGORIES = {
         "YK-11", "Cardarine (GW-501516)", "SR9009"
     ]
 }
+
+# Other names people use for a compound: abbreviations, brand and generic names.
+# Hyphen/space variations are added automatically; aliases only match as whole words.
+COMPOUND_ALIASES = {
+    "BPC-157": ["body protection compound"],
+    "TB-500": ["thymosin beta-4", "tb4"],
+    "CJC-1295": ["cjc", "mod grf 1-29", "modified grf"],
+    "Ipamorelin": ["ipa", "ipam"],
+    "Tesamorelin": ["tesa", "egrifta"],
+    "MK-677": ["ibutamoren", "nutrobal"],
+    "PT-141": ["bremelanotide", "vyleesi"],
+    "Melanotan II": ["melanotan 2", "mt-2", "mt-ii"],
+    "GHK-Cu": ["ghk", "copper peptide"],
+    "Thymosin Alpha-1": ["ta-1", "thymosin a1", "thymalfasin"],
+    "AOD-9604": ["aod"],
+    "DSIP": ["delta sleep inducing peptide"],
+    "Epithalon": ["epitalon", "epithalone"],
+    "LL-37": ["cathelicidin"],
+    "Testosterone": ["trt"],
+    "Testosterone Cypionate": ["test cyp", "testosterone cyp", "cypionate"],
+    "Testosterone Enanthate": ["test enanthate", "enanthate"],
+    "HCG": ["pregnyl", "novarel"],
+    "Clomiphene": ["clomid", "clomiphene citrate"],
+    "Anastrozole": ["arimidex", "adex"],
+    "Progesterone": ["prometrium"],
+    "Estradiol": ["e2"],
+    "Thyroid (T3/T4)": ["t3", "t4", "levothyroxine", "liothyronine", "synthroid", "cytomel"],
+    "Growth Hormone": ["hgh", "somatropin"],
+    "Ostarine (MK-2866)": ["ostarine", "mk-2866", "enobosarm"],
+    "RAD-140": ["testolone"],
+    "LGD-4033": ["ligandrol"],
+    "S-4 (Andarine)": ["andarine", "s-4"],
+    "Cardarine (GW-501516)": ["cardarine", "gw-501516"],
+    "SR9009": ["stenabolic", "sr-9009"],
+}
+COMPOUND_FUZZY_MATCHING = os.getenv("COMPOUND_FUZZY_MATCHING", "true").lower() == "true"  # Match misspelled names (1-2 edits)
@@ -0,0 +1,29 @@
+import threading
+import requests
+from benchmarks.mock_server import MockSettings, start_mock_server
+from utils.perplexity_client import PerplexityClient, create_session
+from utils.resilience import HedgePolicy
+
+
+def test_hedged_error_responses_return_their_connections():
+    server, url = start_mock_server(MockSettings(latency=0, error_rate=1.0, error_status=400))
+    client = PerplexityClient(
+        api_key="test", coalesce=False, session=create_session(pool_maxsize=2, pool_block=True),
+        hedge=HedgePolicy(initial_delay=5.0)
+    )
+    client.base_url = f"{url}/chat/completions"
+    errors = []
+
+    def ask():
+        for i in range(6):
+            try:
+                "".join(client.stream_answer(f"What is BPC-157? ({i})", "overview", ["BPC-157"]))
+            except requests.HTTPError as e:
+                errors.append(e)
+
+    worker = threading.Thread(target=ask, daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    server.shutdown()
+    assert not worker.is_alive(), "hedged requests hung waiting for a pooled connection"
+    assert len(errors) == 6
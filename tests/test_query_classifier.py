@@ -0,0 +1,78 @@
+import itertools
+import random
+import re
+from utils.query_classifier import QUERY_PATTERNS, classify_query, score_query_types
+
+SEPARATORS = [" ", "  ", "-", "_", "", "\t", ", ", ". ", "/"]
+FILLERS = ["what", "is", "the", "bpc-157", "tb-500", "for", "my", "knee", "and", "?", "!", "x", "99", "dosing", "safely"]
+
+
+def baseline_scores(query_lower):
+    """The scorer this replaced: one re.search per pattern."""
+    return {
+        query_type: sum(1 for pattern in patterns if re.search(pattern, query_lower))
+        for query_type, patterns in QUERY_PATTERNS.items()
+    }
+
+
+def expand(pattern):
+    """Every literal string the (simple) pattern syntax in QUERY_PATTERNS can produce."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith(r"\b", i):
+            i += 2
+            continue
+        if pattern.startswith(".*", i):
+            options, i = [" ", " and then "], i + 2
+        elif pattern.startswith("(?:", i):
+            end = pattern.index(")", i)
+            options, i = pattern[i + 3:end].split("|"), end + 1
+        elif pattern[i] == "\\":
+            options, i = [pattern[i + 1]], i + 2
+        else:
+            options, i = [pattern[i]], i + 1
+        if i < len(pattern) and pattern[i] == "?":
+            options, i = options + [""], i + 1
+        parts.append(options)
+    return ["".join(choice) for choice in itertools.product(*parts)]
+
+
+KEYWORDS = sorted({text for patterns in QUERY_PATTERNS.values() for pattern in patterns for text in expand(pattern)})
+
+
+def assert_parity(query):
+    query_lower = query.lower().strip()
+    assert score_query_types(query_lower) == baseline_scores(query_lower), query
+
+
+def test_every_pattern_keyword_matches_its_pattern():
+    for patterns in QUERY_PATTERNS.values():
+        for pattern in patterns:
+            for text in expand(pattern):
+                assert re.search(pattern, text), (pattern, text)
+
+
+def test_parity_on_every_keyword_and_separator_variant():
+    for keyword in KEYWORDS:
+        for separator in SEPARATORS:
+            text = keyword.replace(" ", separator)
+            for query in (text, f"x{text}", f"{text}x", f"({text})", f"{text}?", f"the {text}s", f"{text}'s"):
+                assert_parity(query)
+
+
+def test_parity_on_random_mixes():
+    rng = random.Random(5)
+    words = KEYWORDS + FILLERS
+    for _ in range(5000):
+        pieces = rng.choices(words, k=rng.randint(1, 6))
+        query = "".join(piece + rng.choice(SEPARATORS) for piece in pieces)
+        assert_parity(query)
+        assert_parity(query.upper())
+
+
+def test_sample_queries_classify_as_before():
+    assert classify_query("How much BPC-157 should I take?")[0] == "dosage"
+    assert classify_query("BPC-157 vs TB-500")[:2] == ("comparison", ["BPC-157", "TB-500"])
+    assert classify_query("Side effects of testosterone cypionate")[0] == "side_effects"
+    assert classify_query("What is BPC-157?") == ("overview", ["BPC-157"], 0.5)
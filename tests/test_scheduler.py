@@ -0,0 +1,46 @@
+from benchmarks.mock_server import MockSettings, start_mock_server
+from utils.perplexity_client import PerplexityClient
+from utils.scheduler import FairScheduler, request_class
+
+
+class RecordingScheduler(FairScheduler):
+    def __init__(self):
+        super().__init__(max_in_flight=4, reserved=1)
+        self.seen = []
+
+    def acquire(self, priority="chat", session=None):
+        self.seen.append((priority, session))
+        super().acquire(priority, session)
+
+
+def _client(scheduler):
+    server, url = start_mock_server(MockSettings(latency=0, tokens_per_second=0, answer_words=10, citations=1))
+    client = PerplexityClient(api_key="test", scheduler=scheduler)
+    client.base_url = f"{url}/chat/completions"
+    return server, client
+
+
+def test_request_class_reaches_scheduler_through_coalescing():
+    scheduler = RecordingScheduler()
+    server, client = _client(scheduler)
+    try:
+        assert client.single_flight is not None
+        with request_class("interactive", "session-1"):
+            "".join(client.stream_query("What is BPC-157?", "overview", ["BPC-157"]))
+        with request_class("background", "batch"):
+            "".join(client.stream_query("What is TB-500?", "overview", ["TB-500"]))
+    finally:
+        server.shutdown()
+    assert scheduler.seen == [("interactive", "session-1"), ("background", "batch")]
+    assert scheduler.in_flight == 0
+
+
+def test_comparison_profiles_keep_request_class():
+    scheduler = RecordingScheduler()
+    server, client = _client(scheduler)
+    try:
+        with request_class("background", "batch"):
+            "".join(client.stream_query("Compare BPC-157 and TB-500", "comparison", ["BPC-157", "TB-500"]))
+    finally:
+        server.shutdown()
+    assert scheduler.seen and set(scheduler.seen) == {("background", "batch")}
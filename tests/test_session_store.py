@@ -0,0 +1,41 @@
+import sqlite3
+from utils.conversation import SOURCES_MARKER
+from utils.prompts import MEDICAL_DISCLAIMER
+from utils.session_store import SQLiteSessionStore
+
+
+def _answer(n):
+    return {"role": "assistant", "content": f"Answer {n}.{SOURCES_MARKER}source-{n}.example{MEDICAL_DISCLAIMER}"}
+
+
+def _fragment_count(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM fragments").fetchone()[0]
+
+
+def test_clear_removes_fragments_only_that_session_used(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SQLiteSessionStore(path)
+    for n in range(3):
+        store.append("a", _answer(n))
+    store.append("b", _answer(9))
+    assert _fragment_count(path) == 5  # Four source lists and one shared disclaimer
+
+    store.clear("a")
+    assert store.count("a") == 0
+    assert _fragment_count(path) == 2
+    assert store.page("b")[0]["content"] == _answer(9)["content"]
+
+    store.clear("b")
+    assert _fragment_count(path) == 0
+
+
+def test_repeated_fragment_survives_until_last_reference(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SQLiteSessionStore(path)
+    store.append("a", _answer(1))
+    store.append("b", _answer(1))
+    store.clear("a")
+    assert store.page("b")[0]["content"] == _answer(1)["content"]
+    store.clear("b")
+    assert _fragment_count(path) == 0
@@ -0,0 +1,38 @@
+import hashlib
+from utils.query_classifier import classify_query
+from utils.similar_questions import SimilarQuestionIndex
+
+
+def _key(question):
+    return hashlib.sha256(question.encode("utf-8")).hexdigest()
+
+
+def _index(*questions):
+    index = SimilarQuestionIndex(threshold=0.8)
+    for question in questions:
+        query_type, compounds, _ = classify_query(question)
+        index.add(query_type, compounds, question, _key(question))
+    return index
+
+
+def _lookup(index, question):
+    query_type, compounds, _ = classify_query(question)
+    return index.lookup(query_type, compounds, question)
+
+
+def test_different_amounts_do_not_match():
+    index = _index("Is 1000mg of BPC-157 safe?", "bpc 157 dose for a 1000 lb person")
+    assert _lookup(index, "Is 100mg of BPC-157 safe?") is None
+    assert _lookup(index, "bpc 157 dose for a 100 lb person") is None
+
+
+def test_same_amount_matches_with_or_without_space():
+    index = _index("bpc 157 dose for a 100 lb person")
+    assert _lookup(index, "BPC-157 dose for a 100lbs person") == _key("bpc 157 dose for a 100 lb person")
+
+
+def test_daily_dose_matches_plain_dose_question():
+    index = _index("How much BPC 157 should I take")
+    assert _lookup(index, "bpc157 dosage per day") == _key("How much BPC 157 should I take")
+    assert _lookup(index, "BPC-157 dose?") == _key("How much BPC 157 should I take")
+    assert _lookup(index, "bpc157 dosage per week") is None
@@ -1,15 +1,19 @@
 """EvidenceLab utilities"""
-from utils.query_classifier import classify_query, extract_compounds, get_query_context
+from utils.query_classifier import classify_query, classify_queries, extract_compounds, find_compounds, score_compounds, get_query_context
 from utils.perplexity_client import PerplexityClient, ask_evidencelab
-from utils.prompts import SYSTEM_PROMPT, get_query_prompt, MEDICAL_DISCLAIMER
+from utils.prompts import SYSTEM_PROMPT, PROMPTS, get_query_prompt, MEDICAL_DISCLAIMER
 
 __all__ = [
     "classify_query",
+    "classify_queries",
     "extract_compounds", 
+    "find_compounds",
+    "score_compounds",
     "get_query_context",
     "PerplexityClient",
     "ask_evidencelab",
     "SYSTEM_PROMPT",
+    "PROMPTS",
     "get_query_prompt",
     "MEDICAL_DISCLAIMER"
 ]
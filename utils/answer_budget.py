@@ -0,0 +1,105 @@
+"""
+Answer Budget - Per-query-type output caps and a soft sentence-boundary cutoff
+"""
+import math
+import re
+from typing import Optional
+from config import (
+    RESPONSE_TARGETS, ANSWER_BUDGET_ENABLED, ANSWER_TOKENS_PER_WORD,
+    ANSWER_SOFT_LIMIT_FACTOR, ANSWER_HARD_LIMIT_FACTOR
+)
+from utils.metrics import metrics
+
+WORD_BUCKETS = (25, 50, 75, 100, 150, 200, 250, 300, 400, 600, 1000)
+RATIO_BUCKETS = (0.5, 0.75, 0.9, 1.0, 1.1, 1.25, 1.5, 2.0, 3.0)
+
+# End of a sentence (punctuation followed by whitespace) or of a line / list item
+SENTENCE_END = re.compile(r"[.!?](?=\s)|\n")
+WORD = re.compile(r"\S+")
+
+
+def max_tokens_for(query_type: str) -> Optional[int]:
+    """Upstream max_tokens for a query type, or None when it has no target."""
+    target = RESPONSE_TARGETS.get(query_type)
+    if not ANSWER_BUDGET_ENABLED or not target:
+        return None
+    return math.ceil(target["max"] * ANSWER_HARD_LIMIT_FACTOR * ANSWER_TOKENS_PER_WORD)
+
+
+def word_limit_for(query_type: str) -> Optional[int]:
+    """Words after which the stream ends at the next sentence boundary, or None."""
+    target = RESPONSE_TARGETS.get(query_type)
+    if not ANSWER_BUDGET_ENABLED or not target:
+        return None
+    return math.ceil(target["max"] * ANSWER_SOFT_LIMIT_FACTOR)
+
+
+class SoftCutoff:
+    """
+    Counts words across streamed chunks and ends the answer at the first
+    sentence boundary once `limit` words have been passed.
+
+    feed() returns the part of each chunk to pass on; once `done` is set the
+    rest of the stream should be dropped. A trailing ".", "!" or "?" is held
+    back until the next chunk shows whether it ends a sentence.
+    """
+
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self.words = 0
+        self.done = False
+        self.held = ""
+        self.in_word = False
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        text = self.held + chunk
+        self.held = ""
+        start = self._limit_offset(text)
+        if start is not None:
+            match = SENTENCE_END.search(text, start)
+            if match:
+                self.done = True
+                text = text[:match.end()].rstrip()
+            elif text[-1:] in (".", "!", "?"):
+                text, self.held = text[:-1], text[-1]
+        self._count(text)
+        return text
+
+    def flush(self) -> str:
+        """Release any held-back punctuation at the end of the stream."""
+        held, self.held = self.held, ""
+        return held
+
+    def _limit_offset(self, text: str) -> Optional[int]:
+        """Offset in text where the word limit is reached, or None if it is not reached."""
+        if self.limit is None:
+            return None
+        words = self.words
+        if words >= self.limit:
+            return 0
+        for match in WORD.finditer(text):
+            if not (match.start() == 0 and self.in_word):
+                words += 1
+            if words >= self.limit:
+                return match.end()
+        return None
+
+    def _count(self, text: str):
+        for match in WORD.finditer(text):
+            if not (match.start() == 0 and self.in_word):
+                self.words += 1
+        if text:
+            self.in_word = not text[-1].isspace()
+
+
+def record_length(query_type: str, text: str, truncated: Optional[str] = None):
+    """Record answer length against the query type's target; truncated is "soft", "max_tokens" or None."""
+    words = len(text.split())
+    metrics.observe("answer_words", words, buckets=WORD_BUCKETS, query_type=query_type)
+    target = RESPONSE_TARGETS.get(query_type)
+    if target:
+        metrics.observe("answer_target_ratio", words / target["max"], buckets=RATIO_BUCKETS, query_type=query_type)
+    if truncated:
+        metrics.inc("answer_truncated_total", query_type=query_type, reason=truncated)
@@ -0,0 +1,210 @@
+"""
+Answer Cache - Two-tier (memory LRU + SQLite) cache for generated answers
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_STALE_GRACE,
+    ANSWER_CACHE_MEMORY_ENTRIES, ANSWER_CACHE_DISK_ENTRIES
+)
+
+_PUNCTUATION = re.compile(r"[^\w\s\-]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    question = _PUNCTUATION.sub(" ", question.lower())
+    return _WHITESPACE.sub(" ", question).strip()
+
+
+def make_cache_key(query_type: str, compounds: list[str], question: str, context: str = "") -> str:
+    """Build a stable key from the classified query, the normalized question and any conversation context."""
+    raw = "|".join([query_type, ",".join(sorted(compounds)), normalize_question(question)])
+    if context:
+        raw += "|" + context
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """
+    Thread-safe in-memory LRU with TTL.
+
+    Expired entries are kept for `stale_grace` more seconds and only returned
+    with allow_stale, as a fallback while upstream is down.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MEMORY_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 stale_grace: float = ANSWER_CACHE_STALE_GRACE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_grace = stale_grace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, allow_stale: bool = False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            age = time.time() - entry["created_at"]
+            if age > self.ttl + self.stale_grace:
+                del self._entries[key]
+                return None
+            if age > self.ttl and not allow_stale:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """On-disk cache tier with TTL and least-recently-used eviction; keeps stale entries like MemoryCache."""
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, max_entries: int = ANSWER_CACHE_DISK_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 stale_grace: float = ANSWER_CACHE_STALE_GRACE):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_grace = stale_grace
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                citations TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str, allow_stale: bool = False):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, citations, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[2] > self.ttl + self.stale_grace:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            if now - row[2] > self.ttl and not allow_stale:
+                return None
+            self._conn.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return {"content": row[0], "citations": json.loads(row[1]), "created_at": row[2]}
+
+    def set(self, key: str, entry: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, content, citations, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, entry["content"], json.dumps(entry["citations"]), entry["created_at"], time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl - self.stale_grace,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+
+class AnswerCache:
+    """
+    Memory tier in front of an optional SQLite tier.
+
+    Pinned entries (the warmed Quick Lookup matrix) sit in front of both and are
+    never evicted by LRU; set() keeps them current and they still expire by TTL.
+    """
+
+    def __init__(self, memory: MemoryCache = None, disk: SQLiteCache = None):
+        self.memory = memory or MemoryCache()
+        self.disk = disk
+        self.pinned = {}
+
+    def pin(self, key: str, entry: dict):
+        self.pinned[key] = entry
+
+    def get(self, key: str):
+        entry = self.pinned.get(key)
+        if entry is not None and time.time() - entry["created_at"] <= self.memory.ttl:
+            return entry
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    def get_stale(self, key: str):
+        """The newest stored answer for a key even if expired (within the stale grace), or None."""
+        entry = self.pinned.get(key)
+        if entry is None:
+            entry = self.memory.get(key, allow_stale=True)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key, allow_stale=True)
+        return entry
+
+    def set(self, key: str, content: str, citations: list[str]):
+        entry = {"content": content, "citations": list(citations), "created_at": time.time()}
+        if key in self.pinned:
+            self.pinned[key] = entry
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            self.disk.set(key, entry)
+
+    def clear(self):
+        self.pinned.clear()
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache, or None when caching is disabled."""
+    global _default_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            disk = SQLiteCache() if ANSWER_CACHE_PATH else None
+            _default_cache = AnswerCache(MemoryCache(), disk)
+        return _default_cache
@@ -0,0 +1,352 @@
+"""
+Asyncio Perplexity client for EvidenceLab - many in-flight questions on one event loop
+"""
+import asyncio
+import contextlib
+import time
+import httpx
+from config import HTTP_POOL_MAXSIZE
+from utils.perplexity_client import BasePerplexityClient, SSEDecoder
+from utils.answer_cache import get_answer_cache
+from utils.conversation import build_history
+from utils.comparison import profile_question, should_fan_out
+from utils.resilience import RETRY_STATUSES, CircuitOpen, get_circuit_breaker, get_hedge_policy, get_rate_limiter
+from utils.scheduler import current_request_class, get_scheduler, request_class
+from utils.similar_questions import get_similar_index
+from utils.metrics import metrics
+
+
+class AsyncPerplexityClient(BasePerplexityClient):
+    """Async counterpart of PerplexityClient with the same prompts, cache and answer tail."""
+
+    def __init__(self, api_key=None, stream=True, http_client=None, cache=None, max_connections=HTTP_POOL_MAXSIZE, **resilience):
+        super().__init__(api_key, stream, cache, **resilience)
+        self.http = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        )
+        self._background = set()  # Revalidation tasks, referenced until they finish
+
+    async def aclose(self):
+        """Release pooled connections."""
+        await self.http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aiter_sse_events(self, response):
+        """Parse server-sent events from a streaming response as bytes arrive."""
+        decoder = SSEDecoder()
+        async for line in response.aiter_lines():
+            event = decoder.feed(line.rstrip("\r\n"))
+            if event is SSEDecoder.DONE:
+                return
+            if event is not None:
+                yield event
+        event = decoder.flush()
+        if event is not None and event is not SSEDecoder.DONE:
+            yield event
+
+    @contextlib.asynccontextmanager
+    async def open_response(self, body, query_type="overview", acquire=True):
+        """
+        POST with timeouts and the shared rate limiter, retrying failures before the first byte.
+
+        Pass acquire=False when the caller already holds a limiter token for the first attempt.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter and (acquire or attempt):
+                with metrics.timer("stage_seconds", stage="rate_limit", query_type=query_type):
+                    await asyncio.sleep(self.rate_limiter.reserve())
+            started = time.perf_counter()
+            try:
+                request = self.http.build_request("POST", self.base_url, headers=self.headers(), content=body)
+                with metrics.timer("stage_seconds", stage="connect", query_type=query_type):
+                    response = await self.http.send(request, stream=True)
+            except httpx.TransportError:
+                self.record_outcome(False, started)
+                delay = self.retry_delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                self.record_outcome(response.status_code not in RETRY_STATUSES, started)
+                delay = None if response.is_success else self.retry_delay(attempt, response.status_code, response.headers)
+                if delay is None:
+                    try:
+                        yield response
+                    finally:
+                        await response.aclose()
+                    return
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aresponse_events(self, response):
+        """Raise for an error status, else iterate the response's events."""
+        if response.is_error:
+            await response.aread()
+        response.raise_for_status()
+        if self.stream:
+            return self.aiter_sse_events(response)
+        await response.aread()
+        return _aiter([response.json()])
+
+    @contextlib.asynccontextmanager
+    async def open_events(self, body, query_type="overview"):
+        """
+        Send the request (hedged when enabled) and yield its events, closing the response afterwards.
+
+        The request holds a scheduler slot until its response is closed.
+        """
+        async with contextlib.AsyncExitStack() as slot:
+            if self.scheduler:
+                await slot.enter_async_context(self.scheduler.aslot())
+            if self.hedge is None:
+                async with self.open_response(body, query_type) as response:
+                    yield await self.aresponse_events(response)
+                return
+            stack, events = await self.aopen_hedged(body, query_type)
+            async with stack:
+                yield events
+
+    async def aopen_hedged(self, body, query_type="overview"):
+        """
+        Send the request and, if its first event is later than usual, one duplicate.
+
+        Returns an exit stack owning the response of whichever attempt delivers its
+        first event first, and that attempt's events; the other attempt is
+        cancelled. Errors only surface once every attempt has failed.
+
+        The duplicate takes its own scheduler slot, and is skipped if none is
+        free; the slot is returned once only one attempt is left open.
+        """
+        state = {"live": 1, "hedge_slot": False}
+
+        def attempt_over():
+            state["live"] -= 1
+            if state["live"] <= 1 and state["hedge_slot"]:
+                state["hedge_slot"] = False
+                self.scheduler.release()
+
+        async def attempt(hedged):
+            started = time.perf_counter()
+            stack = contextlib.AsyncExitStack()
+            try:
+                response = await stack.enter_async_context(self.open_response(body, query_type, acquire=not hedged))
+                events = await self.aresponse_events(response)
+                try:
+                    first = await events.__anext__()
+                except StopAsyncIteration:
+                    return stack, events, started
+            except BaseException:
+                await stack.aclose()
+                attempt_over()
+                raise
+            return stack, _achain(first, events), started
+
+        async def close_loser(task):
+            await task.result()[0].aclose()
+            attempt_over()
+
+        primary = asyncio.ensure_future(attempt(False))
+        done, pending = await asyncio.wait({primary}, timeout=self.hedge.delay(query_type))
+        hedge = None
+        if not done:
+            slot = self.scheduler is None or self.scheduler.try_acquire(*current_request_class())
+            if slot and self.hedge.try_hedge(self.rate_limiter):
+                state["live"] += 1
+                state["hedge_slot"] = self.scheduler is not None
+                hedge = asyncio.ensure_future(attempt(True))
+                pending.add(hedge)
+            else:
+                if slot and self.scheduler is not None:
+                    self.scheduler.release()
+                metrics.inc("hedge_requests_total", query_type=query_type, result="skipped")
+        self.hedge.record_request(hedge is not None)
+
+        winner = None
+        error = None
+        try:
+            while True:
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+                    else:
+                        await close_loser(task)  # Both answered at once
+                if winner is not None or not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                if not task.cancel() and not task.cancelled() and task.exception() is None:
+                    await close_loser(task)  # Answered while the winner was being settled
+        if winner is None:
+            raise error
+
+        stack, events, started = winner.result()
+        self.hedge.observe(query_type, time.perf_counter() - started)
+        if hedge is not None:
+            metrics.inc("hedge_requests_total", query_type=query_type, result="won" if winner is hedge else "lost")
+        return stack, events
+
+    async def astream_events(self, user_message, query_type="overview", compounds=None, conversation_history=None):
+        """Yield ("content", text) pairs as they arrive, then one ("citations", list) pair."""
+        compounds = compounds or []
+        history = build_history(conversation_history)
+
+        # The answer cache is SQLite; keep its reads and writes off the event loop
+        cache_key, cached = await asyncio.to_thread(self.cached_answer, query_type, compounds, user_message, history)
+        if cached:
+            yield "content", cached["content"]
+            yield "citations", cached["citations"]
+            return
+
+        # During an outage answer at once from the stale store; the probe that tests recovery runs in the background
+        if self.breaker_open():
+            stale = await asyncio.to_thread(self.stale_answer, query_type, compounds, user_message, history)
+            if stale is not None:
+                if self.breaker.allow():
+                    task = asyncio.ensure_future(self.arevalidate(cache_key, user_message, query_type, compounds, history))
+                    self._background.add(task)
+                    task.add_done_callback(self._background.discard)
+                yield "content", self.stale_notice(stale) + stale["content"]
+                yield "citations", stale["citations"]
+                return
+            if not self.breaker.allow():
+                raise CircuitOpen("The research service is temporarily unavailable. Please try again shortly.")
+
+        async for item in self.aupstream_events(cache_key, user_message, query_type, compounds, history):
+            yield item
+
+    async def arevalidate(self, cache_key, user_message, query_type, compounds, history):
+        """Run an upstream answer to completion in the background, refreshing the cache if it succeeds."""
+        try:
+            with request_class("background"):
+                async for _ in self.aupstream_events(cache_key, user_message, query_type, compounds, history):
+                    pass
+        except Exception:
+            pass  # The breaker has recorded the failure
+
+    async def aupstream_events(self, cache_key, user_message, query_type, compounds, history):
+        """Answer upstream, yielding ("content", text) pairs then ("citations", list), and cache the result."""
+        # Multi-compound comparisons merge concurrently fetched profiles; any failed profile falls back to one prompt
+        citations = None
+        profiles = None
+        if should_fan_out(query_type, compounds):
+            profiles = await self.afetch_profiles(compounds)
+            metrics.inc("comparison_fanout_total", result="fallback" if profiles is None else "merged")
+        if profiles is None:
+            payload = self.build_payload(user_message, query_type, compounds, history)
+        else:
+            payload, citations = self.build_merge_payload(user_message, compounds, profiles, history)
+        started = time.perf_counter()
+        first_chunk = None
+
+        async with self.open_events(self.encode_payload(payload, query_type), query_type) as events:
+            data = {}
+            parts = []
+            cutoff = self.soft_cutoff(query_type)
+            async for event in events:
+                data = event
+                content = cutoff.feed(self.event_content(event))
+                if content:
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter()
+                    parts.append(content)
+                    yield "content", content
+                if cutoff.done:
+                    break
+            tail = cutoff.flush()
+            if tail:
+                parts.append(tail)
+                yield "content", tail
+
+        truncated = "soft" if cutoff.done else "max_tokens" if self.event_truncated(data) else None
+        self.record_answer(query_type, started, first_chunk, parts, truncated)
+        if citations is None:
+            citations = self.event_citations(data)
+        await asyncio.to_thread(self.store_answer, cache_key, parts, citations)
+        yield "citations", citations
+
+    async def afetch_profiles(self, compounds):
+        """Answer every compound's profile concurrently (cached ones return at once); None if any fails."""
+        try:
+            with metrics.timer("stage_seconds", stage="profiles", query_type="comparison"):
+                return list(await asyncio.gather(
+                    *(self.aanswer(profile_question(compound), "profile", [compound]) for compound in compounds)
+                ))
+        except Exception:
+            return None
+
+    async def aanswer(self, user_message, query_type="overview", compounds=None, conversation_history=None):
+        """Return the full answer text and its citations; upstream errors raise."""
+        parts = []
+        citations = []
+        async for kind, value in self.astream_events(user_message, query_type, compounds, conversation_history):
+            if kind == "content":
+                parts.append(value)
+            else:
+                citations = value
+        return {"content": "".join(parts), "citations": citations}
+
+    async def astream_query(self, user_message, query_type="overview", compounds=None, conversation_history=None):
+        """Query Perplexity and yield the response followed by citations and disclaimer."""
+        try:
+            citations = []
+            async for kind, value in self.astream_events(user_message, query_type, compounds, conversation_history):
+                if kind == "content":
+                    yield value
+                else:
+                    citations = value
+            for chunk in self.iter_sources(citations):
+                yield chunk
+        except Exception as e:
+            yield f"\n\nError: {str(e)}"
+
+    async def amany(self, questions, concurrency=16):
+        """
+        Classify and answer many questions concurrently, at most `concurrency` in flight.
+
+        Returns one dict per question, in input order, with the classification, the
+        answer and citations, or the error that question raised.
+        """
+        from utils.query_classifier import classify_query
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(question):
+            query_type, compounds, confidence = classify_query(question)
+            result = {"question": question, "query_type": query_type, "compounds": compounds,
+                      "content": None, "citations": [], "error": None}
+            async with semaphore:
+                try:
+                    with request_class("background", "batch"):
+                        result.update(await self.aanswer(question, query_type, compounds))
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+            return result
+
+        return await asyncio.gather(*(run(question) for question in questions))
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+async def _achain(first, rest):
+    yield first
+    async for item in rest:
+        yield item
+
+
+def get_async_client(api_key=None):
+    """Create an async client wired to the shared answer cache."""
+    return AsyncPerplexityClient(api_key, cache=get_answer_cache(), rate_limiter=get_rate_limiter(),
+                                 breaker=get_circuit_breaker(), hedge=get_hedge_policy(),
+                                 scheduler=get_scheduler(), similar=get_similar_index())
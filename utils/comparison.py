@@ -0,0 +1,47 @@
+"""
+Comparison Fan-out - Per-compound profiles merged into one comparison answer
+"""
+import re
+from config import COMPARISON_FANOUT_ENABLED, COMPARISON_FANOUT_MAX_COMPOUNDS
+from utils.prompts import get_comparison_merge_prompt
+
+CITATION_MARKER = re.compile(r"\[(\d+)\]")
+
+
+def should_fan_out(query_type: str, compounds: list[str]) -> bool:
+    return (
+        COMPARISON_FANOUT_ENABLED
+        and query_type == "comparison"
+        and 2 <= len(compounds) <= COMPARISON_FANOUT_MAX_COMPOUNDS
+    )
+
+
+def profile_question(compound: str) -> str:
+    """The fixed question a profile is generated and cached under."""
+    return f"{compound} profile"
+
+
+def merge_profiles(user_query: str, compounds: list[str], profiles: list[dict]) -> tuple[str, list[str]]:
+    """
+    Build the merge prompt from answered profiles and the citation list it refers to.
+
+    Each profile's [n] markers are renumbered into one shared, de-duplicated
+    source list so the merged answer can cite them unchanged.
+    """
+    citations = []
+    index = {}
+    texts = []
+    for profile in profiles:
+        local = []
+        for url in profile["citations"]:
+            if url not in index:
+                citations.append(url)
+                index[url] = len(citations)
+            local.append(index[url])
+
+        def renumber(match, local=local):
+            n = int(match.group(1))
+            return f"[{local[n - 1]}]" if 1 <= n <= len(local) else ""
+
+        texts.append(CITATION_MARKER.sub(renumber, profile["content"]))
+    return get_comparison_merge_prompt(user_query, compounds, texts), citations
@@ -0,0 +1,220 @@
+"""
+Compound Matcher - Single-pass Aho-Corasick matcher over compound names and aliases,
+with a trigram index for misspellings
+"""
+import itertools
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Iterable, Optional
+
+# Characters that may separate the parts of a compound name ("BPC-157", "BPC 157", "BPC157")
+SEPARATORS = ("", " ", "-")
+
+_NAME_SPLIT = re.compile(r"[\s\-]+")
+_WHITESPACE = re.compile(r"\s")
+_TOKEN = re.compile(r"[a-z0-9]+")
+_JOIN = re.compile(r"[^a-z0-9]+")
+
+# Shortest misspelled word considered, and the edits allowed by word length
+FUZZY_MIN_LENGTH = 5
+FUZZY_LONG_LENGTH = 8  # From this length two edits are allowed, below it one
+FUZZY_MAX_TOKENS = 3  # Misspellings may span this many words ("melanotn 2")
+
+
+def trigrams(word: str) -> list[str]:
+    padded = f"^{word}$"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def max_edits(length: int) -> int:
+    if length < FUZZY_MIN_LENGTH:
+        return 0
+    return 2 if length >= FUZZY_LONG_LENGTH else 1
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """Levenshtein distance between a and b, or None once it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        best = i
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            current.append(cost)
+            best = min(best, cost)
+        if best > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+def name_variants(name: str) -> list[str]:
+    """Lowercase surface forms of a compound name with every hyphen/space variation."""
+    parts = [p for p in _NAME_SPLIT.split(name.lower().replace("(", "").replace(")", "")) if p]
+    if not parts:
+        return []
+    variants = []
+    for separators in itertools.product(SEPARATORS, repeat=len(parts) - 1):
+        variant = parts[0]
+        for separator, part in zip(separators, parts[1:]):
+            variant += separator + part
+        variants.append(variant)
+    return variants
+
+
+class CompoundMatcher:
+    """
+    Aho-Corasick automaton mapping surface forms back to canonical compound names.
+
+    Canonical names match anywhere, as before; aliases ("tesa", "ipa", "test cyp")
+    only match as whole words. With fuzzy matching, words and runs of up to
+    FUZZY_MAX_TOKENS words that no exact form covers are looked up in a trigram
+    index of every form. Candidates sharing enough trigrams are checked with a
+    bounded edit distance, so only a handful are ever compared.
+    """
+
+    def __init__(self, names: Iterable[str], aliases: Optional[dict] = None, fuzzy: bool = False):
+        self.names = list(dict.fromkeys(names))
+        self.order = {name: i for i, name in enumerate(self.names)}
+        self.fuzzy = fuzzy
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._forms = {}  # Form with separators removed -> name, for fuzzy lookup
+        self._canonical_forms = set()
+        for name in self.names:
+            for variant in name_variants(name):
+                self._add(variant, name)
+        for name, names in (aliases or {}).items():
+            if name not in self.order:
+                continue
+            for alias in names:
+                for variant in name_variants(alias):
+                    self._add(variant, name, whole_word=True)
+        self._link()
+        self._grams = {}  # Trigram -> forms containing it
+        for form, name in self._forms.items():
+            # Short aliases ("tesa", "ipam") are too close to ordinary words to correct towards
+            if len(form) < (FUZZY_MIN_LENGTH if form in self._canonical_forms else FUZZY_LONG_LENGTH):
+                continue
+            for gram in set(trigrams(form)):
+                self._grams.setdefault(gram, []).append(form)
+        self._lookup_fuzzy = lru_cache(maxsize=50_000)(self._lookup_fuzzy)
+
+    def _add(self, word: str, name: str, whole_word: bool = False):
+        form = _JOIN.sub("", word)
+        self._forms.setdefault(form, name)
+        if not whole_word:
+            self._canonical_forms.add(form)
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][ch] = nxt
+            state = nxt
+        if not any(n == name and length == len(word) for n, length, _ in self._out[state]):
+            self._out[state].append((name, len(word), whole_word))
+
+    def _link(self):
+        # Breadth-first so every failure target is complete before it is used
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def match(self, text: str) -> list[tuple[str, int, int, float]]:
+        """Return (name, start, end, score) for every mention in already-lowercased text; exact mentions score 1.0."""
+        text = _WHITESPACE.sub(" ", text)
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for name, length, whole_word in out[state]:
+                start = i + 1 - length
+                if whole_word and not _is_word(text, start, i + 1):
+                    continue
+                matches.append((name, start, i + 1, 1.0))
+        if self.fuzzy:
+            matches += self._fuzzy_matches(text, matches)
+        matches.sort(key=lambda m: (m[1], -m[2]))
+        return matches
+
+    def find(self, text: str) -> list[tuple[str, int, int]]:
+        """Return (name, start, end) for every mention in already-lowercased text."""
+        return [(name, start, end) for name, start, end, _ in self.match(text)]
+
+    def extract(self, text: str) -> list[str]:
+        """Distinct names mentioned in text, in catalogue order."""
+        found = {name for name, _, _ in self.find(text)}
+        return sorted(found, key=self.order.__getitem__)
+
+    def scores(self, text: str) -> dict:
+        """Best match score per name mentioned in text, in catalogue order."""
+        best = {}
+        for name, _, _, score in self.match(text):
+            best[name] = max(score, best.get(name, 0.0))
+        return {name: best[name] for name in sorted(best, key=self.order.__getitem__)}
+
+    def _fuzzy_matches(self, text, exact):
+        """Misspelled mentions among the words no exact match touches, best first, without overlaps."""
+        covered = [(start, end) for _, start, end, _ in exact]
+        tokens = [(m.start(), m.end()) for m in _TOKEN.finditer(text)
+                  if not any(start < m.end() and m.start() < end for start, end in covered)]
+        candidates = []
+        for i in range(len(tokens)):
+            for j in range(i, min(i + FUZZY_MAX_TOKENS, len(tokens))):
+                if j > i and tokens[j][0] - tokens[j - 1][1] > 1:
+                    break  # Only words separated by a single space or hyphen
+                start, end = tokens[i][0], tokens[j][1]
+                found = self._lookup_fuzzy(_JOIN.sub("", text[start:end]))
+                if found is not None:
+                    candidates.append((found[0], start, end, found[1]))
+        candidates.sort(key=lambda m: (-m[3], m[1] - m[2]))
+        accepted = []
+        for match in candidates:
+            if not any(match[1] < end and start < match[2] for _, start, end, _ in accepted):
+                accepted.append(match)
+        return accepted
+
+    def _lookup_fuzzy(self, word: str):
+        """(name, score) of the closest form within the edit bound for the word's length, or None."""
+        limit = max_edits(len(word))
+        if not limit or word in self._forms:
+            return None  # Exact forms are found by the automaton, with its word rules
+        grams = trigrams(word)
+        shared = {}
+        for gram in set(grams):
+            for form in self._grams.get(gram, ()):
+                shared[form] = shared.get(form, 0) + 1
+        best = None
+        for form, count in shared.items():
+            # Each edit changes at most three trigrams
+            if count < max(len(grams), len(form)) - 3 * limit or form[0] != word[0]:
+                continue
+            distance = bounded_edit_distance(word, form, limit)
+            if distance is None:
+                continue
+            score = 1.0 - distance / max(len(word), len(form))
+            if best is None or score > best[1]:
+                best = (self._forms[form], score)
+        return best
+
+
+def _is_word(text: str, start: int, end: int) -> bool:
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
@@ -0,0 +1,101 @@
+"""
+Conversation - Token-budgeted chat history for follow-up questions
+"""
+import hashlib
+import json
+import math
+import re
+from typing import Optional
+from config import HISTORY_TOKEN_BUDGET, HISTORY_MAX_TURNS, HISTORY_SUMMARY_TURNS, HISTORY_CHARS_PER_TOKEN
+from utils.prompts import MEDICAL_DISCLAIMER
+
+SOURCES_MARKER = "\n\n---\n\n**📚 Sources:**"
+DEBUG_NO_CITATIONS = "\n\n*[Debug: No citations found in response]*"
+CITATION_MARKER = re.compile(r" ?\[\d+\]")
+SUMMARY_QUESTION_CHARS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / HISTORY_CHARS_PER_TOKEN)
+
+
+def strip_answer(content: str) -> str:
+    """Remove the disclaimer, sources list and citation markers from a rendered answer."""
+    content = content.replace(MEDICAL_DISCLAIMER, "")
+    for marker in (SOURCES_MARKER, DEBUG_NO_CITATIONS):
+        index = content.find(marker)
+        if index != -1:
+            content = content[:index]
+    return CITATION_MARKER.sub("", content).strip()
+
+
+def is_error(content: str) -> bool:
+    return content.startswith("❌ Error:") or "\n\nError:" in content
+
+
+def iter_turns(messages: list[dict]):
+    """Yield (question, answer) pairs, newest first, skipping failed or unanswered turns."""
+    answer = None
+    for message in reversed(messages):
+        if message["role"] == "assistant":
+            answer = message["content"]
+        elif message["role"] == "user":
+            if answer and not is_error(answer):
+                yield message["content"], strip_answer(answer)
+            answer = None
+
+
+def build_history(messages: Optional[list[dict]], budget: int = HISTORY_TOKEN_BUDGET, max_turns: int = HISTORY_MAX_TURNS) -> dict:
+    """
+    Select prior turns to resend with a follow-up question.
+
+    The newest turns are kept verbatim (answers stripped of their disclaimer
+    and sources) while they fit in `budget` estimated tokens and `max_turns`;
+    a few of the older questions are folded into a one-line summary and the
+    rest are dropped, so the payload stays bounded however long the chat is.
+
+    Returns {"messages": [alternating user/assistant dicts], "summary": str}.
+    """
+    history = {"messages": [], "summary": ""}
+    if not messages or budget <= 0:
+        return history
+
+    kept = []
+    older = []
+    used = 0
+    for question, answer in iter_turns(messages):
+        cost = estimate_tokens(question) + estimate_tokens(answer)
+        if not older and len(kept) < max_turns and used + cost <= budget:
+            kept.append((question, answer))
+            used += cost
+            continue
+        older.append(question)
+        if len(older) >= HISTORY_SUMMARY_TURNS:
+            break
+
+    for question, answer in reversed(kept):
+        history["messages"].append({"role": "user", "content": question})
+        history["messages"].append({"role": "assistant", "content": answer})
+    if older:
+        questions = [q if len(q) <= SUMMARY_QUESTION_CHARS else q[:SUMMARY_QUESTION_CHARS].rstrip() + "…" for q in reversed(older)]
+        history["summary"] = "Earlier in this conversation the user asked: " + "; ".join(questions)
+    return history
+
+
+def history_fingerprint(history: dict) -> str:
+    """Short digest of the selected history, for cache and single-flight keys."""
+    if not history["messages"] and not history["summary"]:
+        return ""
+    raw = json.dumps(history, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def carry_compounds(compounds: list[str], messages: Optional[list[dict]]) -> list[str]:
+    """Use the compounds of the latest answered turn when a follow-up names none."""
+    if compounds or not messages:
+        return compounds
+    for message in reversed(messages):
+        previous = message.get("metadata", {}).get("compounds")
+        if message["role"] == "assistant" and previous:
+            return list(previous)
+    return compounds
@@ -0,0 +1,214 @@
+"""
+Metrics - In-process histograms and counters with Prometheus and JSONL export
+"""
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_PORT, METRICS_JSONL_PATH, METRICS_DUMP_INTERVAL
+
+# Bucket upper bounds for seconds-valued and size-valued histograms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with count and sum."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "buckets": dict(zip(self.buckets, self.counts)), "overflow": self.counts[-1]}
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of labelled histograms and counters.
+
+    Sinks are callables invoked as sink(kind, name, value, labels) on every
+    observation, for forwarding to StatsD, logs or tests.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self._sinks.remove(sink)
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+        self._emit("histogram", name, value, labels)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._emit("counter", name, amount, labels)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+        self._emit("gauge", name, value, labels)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the with-block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def histogram(self, name: str, **labels):
+        """The histogram for a name and label set, or None if nothing was observed."""
+        with self._lock:
+            return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def _emit(self, kind, name, value, labels):
+        for sink in list(self._sinks):
+            try:
+                sink(kind, name, value, labels)
+            except Exception:
+                pass  # A broken sink must never break a request
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "histograms": [{"name": n, "labels": dict(l), **h.snapshot()} for (n, l), h in self._histograms.items()],
+                "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self._counters.items()],
+                "gauges": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self._gauges.items()],
+            }
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted({n for n, _ in values}):
+                    lines.append(f"# TYPE evidencelab_{name} {kind}")
+                    for (n, labels), value in values.items():
+                        if n == name:
+                            lines.append(f"evidencelab_{name}{_labels(labels)} {value}")
+            for name in sorted({n for n, _ in self._histograms}):
+                lines.append(f"# TYPE evidencelab_{name} histogram")
+                for (n, labels), h in self._histograms.items():
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(h.buckets, h.counts):
+                        cumulative += count
+                        lines.append(f"evidencelab_{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"evidencelab_{name}_bucket{_labels(labels + (('le', '+Inf'),))} {h.count}")
+                    lines.append(f"evidencelab_{name}_sum{_labels(labels)} {h.sum}")
+                    lines.append(f"evidencelab_{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = MetricsRegistry()
+
+
+def serve_metrics(port: int, registry: MetricsRegistry = metrics, host: str = "0.0.0.0"):
+    """Serve /metrics in Prometheus text format from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def dump_jsonl_forever(path: str, interval: float, registry: MetricsRegistry = metrics):
+    """Append a registry snapshot to a JSONL file every `interval` seconds from a daemon thread."""
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registry.snapshot()) + "\n")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_exporters():
+    """Start the exporters enabled in config, once per process."""
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+        if METRICS_PORT:
+            serve_metrics(METRICS_PORT)
+        if METRICS_JSONL_PATH:
+            dump_jsonl_forever(METRICS_JSONL_PATH, METRICS_DUMP_INTERVAL)
@@ -1,19 +1,103 @@
 """
 Perplexity API Client for EvidenceLab
 """
+import contextlib
+import contextvars
+import itertools
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
-from config import PERPLEXITY_API_KEY, PERPLEXITY_BASE_URL, PERPLEXITY_MODEL
-from utils.prompts import SYSTEM_PROMPT, get_query_prompt, MEDICAL_DISCLAIMER
+from config import (
+    PERPLEXITY_API_KEY, PERPLEXITY_BASE_URL, PERPLEXITY_MODEL,
+    HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_POOL_BLOCK,
+    PERPLEXITY_CONNECT_TIMEOUT, PERPLEXITY_READ_TIMEOUT, PERPLEXITY_MAX_RETRIES,
+    COMPARISON_MERGE_MODEL
+)
+from utils.prompts import PROMPTS, MEDICAL_DISCLAIMER
+from utils.answer_cache import get_answer_cache, make_cache_key
+from utils.single_flight import SingleFlight
+from utils.resilience import (
+    RETRY_STATUSES, CircuitBreaker, CircuitOpen, backoff_delay, get_circuit_breaker, get_hedge_policy, get_rate_limiter,
+    parse_retry_after
+)
+from utils.metrics import SIZE_BUCKETS, metrics
+from utils.answer_budget import SoftCutoff, max_tokens_for, record_length, word_limit_for
+from utils.conversation import build_history, history_fingerprint
+from utils.comparison import merge_profiles, profile_question, should_fan_out
+from utils.scheduler import current_request_class, get_scheduler, request_class
+from utils.similar_questions import get_similar_index
 
 
-class PerplexityClient:
-    def __init__(self, api_key=None):
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def create_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=HTTP_POOL_BLOCK):
+    """Build a keep-alive requests session with a bounded connection pool."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class SSEDecoder:
+    """Incremental decoder for server-sent event lines."""
+    DONE = object()
+    
+    def __init__(self):
+        self.data_lines = []
+    
+    def feed(self, line):
+        """Consume one line; return a parsed event, SSEDecoder.DONE, or None."""
+        line = line.decode("utf-8") if isinstance(line, bytes) else line
+        if line.startswith(":"):
+            return None
+        if line.startswith("data:"):
+            self.data_lines.append(line[5:].lstrip())
+            return None
+        if line:
+            return None
+        # Blank line terminates the event
+        return self.flush()
+    
+    def flush(self):
+        """Return whatever event is still buffered."""
+        if not self.data_lines:
+            return None
+        data = "\n".join(self.data_lines)
+        self.data_lines = []
+        if data == "[DONE]":
+            return self.DONE
+        return json.loads(data)
+
+
+class BasePerplexityClient:
+    """Request construction and response handling shared by the sync and async clients."""
+    
+    def __init__(self, api_key=None, stream=True, cache=None, rate_limiter=None, max_retries=PERPLEXITY_MAX_RETRIES,
+                 connect_timeout=PERPLEXITY_CONNECT_TIMEOUT, read_timeout=PERPLEXITY_READ_TIMEOUT, breaker=None, hedge=None,
+                 scheduler=None, similar=None):
         self.api_key = api_key or PERPLEXITY_API_KEY
         if not self.api_key:
             raise ValueError("PERPLEXITY_API_KEY not set.")
-        self.base_url = "https://api.perplexity.ai/chat/completions"
+        self.base_url = f"{PERPLEXITY_BASE_URL}/chat/completions"
         self.model = PERPLEXITY_MODEL
+        self.stream = stream
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.breaker = breaker
+        self.hedge = hedge
+        self.scheduler = scheduler
+        self.similar = similar
     
     def shorten_url(self, url):
         """Extract domain name from URL for display."""
@@ -26,58 +110,498 @@ class PerplexityClient:
         except:
             return url
     
-    def stream_query(self, user_message, query_type="overview", compounds=None, conversation_history=None):
-        """Query Perplexity and return response with citations."""
-        specific_prompt = get_query_prompt(query_type, user_message, compounds or [])
+    def event_content(self, event):
+        """Extract the text carried by a streamed delta or a full completion."""
+        choices = event.get("choices") or []
+        if not choices:
+            return ""
+        choice = choices[0]
+        message = choice.get("delta") or choice.get("message") or {}
+        return message.get("content") or ""
+    
+    def event_truncated(self, event):
+        """Whether upstream stopped the answer at max_tokens."""
+        choices = event.get("choices") or []
+        return bool(choices) and choices[0].get("finish_reason") == "length"
+    
+    def event_citations(self, event):
+        """Try different possible citation field names."""
+        return event.get("citations", []) or event.get("sources", []) or event.get("references", [])
+    
+    def iter_sources(self, citations):
+        """Yield the sources list and medical disclaimer that close every answer."""
+        if citations:
+            yield "\n\n---\n\n**📚 Sources:**\n"
+            for i, url in enumerate(citations, 1):
+                short_name = self.shorten_url(url)
+                yield f"\n[{i}] [{short_name}]({url})"
+        else:
+            yield "\n\n*[Debug: No citations found in response]*"
         
-        headers = {
+        yield MEDICAL_DISCLAIMER
+    
+    def headers(self):
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
+    
+    def build_payload(self, user_message, query_type="overview", compounds=None, history=None, prompt=None):
+        """Build the chat/completions request body for a classified question and its build_history() context."""
+        with metrics.timer("stage_seconds", stage="prompt", query_type=query_type):
+            if prompt is None:
+                user_content = PROMPTS.render(query_type, user_message, compounds or [])
+            else:
+                user_content = prompt + PROMPTS.question_suffix.render(user_query=user_message)
+        history = history or {"messages": [], "summary": ""}
+        system_prompt = PROMPTS.system_prompt
+        if history["summary"]:
+            system_prompt += "\n\n" + history["summary"]
         payload = {
             "model": self.model,
             "messages": [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": specific_prompt + "\n\n---\nOriginal question: " + user_message}
+                {"role": "system", "content": system_prompt},
+                *history["messages"],
+                {"role": "user", "content": user_content}
             ],
-            "return_citations": True
+            "return_citations": True,
+            "stream": self.stream
         }
+        max_tokens = max_tokens_for(query_type)
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        return payload
+    
+    def cache_key(self, query_type, compounds, user_message, history=None):
+        """Key an answer on its question, its prompt template version and, for follow-ups, its history."""
+        context = PROMPTS.version(query_type)
+        fingerprint = history_fingerprint(history) if history else ""
+        if fingerprint:
+            context += ":" + fingerprint
+        return make_cache_key(query_type, compounds, user_message, context)
+    
+    def cached_answer(self, query_type, compounds, user_message, history=None):
+        """
+        Return (cache_key, cached entry or None).
+        
+        A standalone question with no exact entry is answered from the entry of a
+        reworded earlier question in the same bucket; otherwise it is indexed so
+        later rewordings find its answer.
+        """
+        cache_key = self.cache_key(query_type, compounds, user_message, history)
+        if not self.cache:
+            return cache_key, None
+        cached = self.cache.get(cache_key)
+        result = "hit" if cached else "miss"
+        if cached is None and self.similar is not None and not (history and history_fingerprint(history)):
+            with metrics.timer("stage_seconds", stage="similar_lookup", query_type=query_type):
+                similar_key = self.similar.lookup(query_type, compounds, user_message)
+            if similar_key is not None and similar_key != cache_key:
+                cached = self.cache.get(similar_key)
+            if cached is not None:
+                result = "similar_hit"
+            else:
+                self.similar.add(query_type, compounds, user_message, cache_key)
+        metrics.inc("cache_requests_total", result=result, query_type=query_type)
+        return cache_key, cached
+    
+    def retry_delay(self, attempt, status=None, headers=None):
+        """Seconds to wait before retrying, or None if the attempt should not be retried."""
+        if attempt >= self.max_retries or (status is not None and status not in RETRY_STATUSES):
+            return None
+        if self.breaker and self.breaker.state == CircuitBreaker.OPEN:
+            return None  # Retrying into an outage only adds load and latency
+        return backoff_delay(attempt, parse_retry_after((headers or {}).get("Retry-After")))
+    
+    def record_outcome(self, ok, started):
+        """Report an upstream attempt to the circuit breaker; 4xx responses other than 429 count as healthy."""
+        if self.breaker:
+            self.breaker.record(ok, time.perf_counter() - started)
+    
+    def breaker_open(self):
+        """Whether the breaker is open or probing, so answers should come from the stale path."""
+        return self.breaker is not None and self.breaker.state != CircuitBreaker.CLOSED
+    
+    def stale_answer(self, query_type, compounds, user_message, history=None):
+        """The latest stored answer for this classified question, expired or not, or None."""
+        if not self.cache:
+            return None
+        entry = self.cache.get_stale(self.cache_key(query_type, compounds, user_message, history))
+        if entry is None and history:
+            entry = self.cache.get_stale(self.cache_key(query_type, compounds, user_message))
+        metrics.inc("stale_answers_total", result="served" if entry else "missing", query_type=query_type)
+        return entry
+    
+    def stale_notice(self, entry):
+        saved = time.strftime("%Y-%m-%d", time.localtime(entry["created_at"]))
+        return f"*⚠️ The research service is temporarily unavailable. This is a saved answer from {saved} and may be out of date.*\n\n"
+    
+    def encode_payload(self, payload, query_type="overview"):
+        """Serialize the request body once, recording its size."""
+        body = json.dumps(payload).encode("utf-8")
+        metrics.observe("payload_bytes", len(body), buckets=SIZE_BUCKETS, query_type=query_type)
+        return body
+    
+    def build_merge_payload(self, user_message, compounds, profiles, history=None):
+        """Return (payload, citations) for merging per-compound profiles into a comparison."""
+        prompt, citations = merge_profiles(user_message, compounds, profiles)
+        payload = self.build_payload(user_message, "comparison", compounds, history, prompt=prompt)
+        payload["model"] = COMPARISON_MERGE_MODEL
+        return payload, citations
+    
+    def soft_cutoff(self, query_type="overview"):
+        """Sentence-boundary cutoff for one streamed answer."""
+        return SoftCutoff(word_limit_for(query_type))
+    
+    def record_answer(self, query_type, started, first_chunk, parts, truncated=None):
+        """Record time to first chunk, full upstream time, response size and length against target."""
+        finished = time.perf_counter()
+        text = "".join(parts)
+        if first_chunk is not None:
+            metrics.observe("stage_seconds", first_chunk - started, stage="first_byte", query_type=query_type)
+        metrics.observe("stage_seconds", finished - started, stage="upstream", query_type=query_type)
+        metrics.observe("response_bytes", len(text.encode("utf-8")), buckets=SIZE_BUCKETS, query_type=query_type)
+        record_length(query_type, text, truncated)
+    
+    def store_answer(self, cache_key, parts, citations):
+        if self.cache and parts:
+            self.cache.set(cache_key, "".join(parts), citations)
+
+
+class PerplexityClient(BasePerplexityClient):
+    def __init__(self, api_key=None, stream=True, session=None, cache=None, coalesce=True, **resilience):
+        super().__init__(api_key, stream, cache, **resilience)
+        self.session = session or create_session()
+        # Identical concurrent questions share one upstream call
+        self.single_flight = SingleFlight() if coalesce else None
+    
+    def close(self):
+        """Release pooled connections."""
+        self.session.close()
+    
+    def iter_sse_events(self, response):
+        """Parse server-sent events from a streaming response as bytes arrive."""
+        decoder = SSEDecoder()
+        for line in response.iter_lines(chunk_size=None, decode_unicode=False):
+            event = decoder.feed(line)
+            if event is SSEDecoder.DONE:
+                return
+            if event is not None:
+                yield event
+        event = decoder.flush()
+        if event is not None and event is not SSEDecoder.DONE:
+            yield event
+    
+    def stream_answer(self, user_message, query_type="overview", compounds=None, conversation_history=None):
+        """Yield answer text as it arrives and return the citations; upstream errors raise."""
+        compounds = compounds or []
+        history = build_history(conversation_history)
         
+        # Cache hits stream back instantly with their stored citations
+        cache_key, cached = self.cached_answer(query_type, compounds, user_message, history)
+        if cached:
+            yield cached["content"]
+            return cached["citations"]
+        
+        if should_fan_out(query_type, compounds):
+            produce = lambda: self.stream_comparison(cache_key, user_message, compounds, history)
+        else:
+            payload = self.build_payload(user_message, query_type, compounds, history)
+            produce = lambda: self.stream_upstream(cache_key, payload, query_type)
+        
+        # During an outage answer at once from the stale store; the probe that tests recovery runs in the background
+        if self.breaker_open():
+            stale = self.stale_answer(query_type, compounds, user_message, history)
+            if stale is not None:
+                if self.breaker.allow():
+                    self.revalidate(produce)
+                yield self.stale_notice(stale) + stale["content"]
+                return stale["citations"]
+            if not self.breaker.allow():
+                raise CircuitOpen("The research service is temporarily unavailable. Please try again shortly.")
+        
+        if self.single_flight:
+            return (yield from self.single_flight.stream(cache_key, produce))
+        return (yield from produce())
+    
+    def revalidate(self, produce):
+        """Run an upstream answer to completion on a daemon thread, refreshing the cache if it succeeds."""
+        def drain():
+            try:
+                with request_class("background"):
+                    for _ in produce():
+                        pass
+            except Exception:
+                pass  # The breaker has recorded the failure
+        
+        threading.Thread(target=drain, daemon=True).start()
+    
+    def fetch_profiles(self, compounds):
+        """Answer every compound's profile concurrently (cached ones return at once); None if any fails."""
+        # Profiles are scheduled with the caller's priority and session
+        context = contextvars.copy_context()
+        
+        def profile(compound):
+            return context.copy().run(self.answer, profile_question(compound), "profile", [compound])
+        
+        try:
+            with metrics.timer("stage_seconds", stage="profiles", query_type="comparison"):
+                with ThreadPoolExecutor(max_workers=len(compounds)) as pool:
+                    return list(pool.map(profile, compounds))
+        except Exception:
+            return None
+    
+    def stream_comparison(self, cache_key, user_message, compounds, history=None):
+        """Fan out per-compound profiles, then stream a short merge into the comparison format."""
+        profiles = self.fetch_profiles(compounds)
+        if profiles is None:
+            # Any failed profile falls back to the single comparison prompt
+            metrics.inc("comparison_fanout_total", result="fallback")
+            payload = self.build_payload(user_message, "comparison", compounds, history)
+            return (yield from self.stream_upstream(cache_key, payload, "comparison"))
+        metrics.inc("comparison_fanout_total", result="merged")
+        payload, citations = self.build_merge_payload(user_message, compounds, profiles, history)
+        return (yield from self.stream_upstream(cache_key, payload, "comparison", citations))
+    
+    def open_response(self, body, query_type="overview", acquire=True):
+        """
+        POST with timeouts and the shared rate limiter, retrying failures before the first byte.
+        
+        Pass acquire=False when the caller already holds a limiter token for the first attempt.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter and (acquire or attempt):
+                with metrics.timer("stage_seconds", stage="rate_limit", query_type=query_type):
+                    self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                with metrics.timer("stage_seconds", stage="connect", query_type=query_type):
+                    response = self.session.post(
+                        self.base_url, headers=self.headers(), data=body, stream=self.stream,
+                        timeout=(self.connect_timeout, self.read_timeout)
+                    )
+            except (requests.ConnectionError, requests.Timeout):
+                self.record_outcome(False, started)
+                delay = self.retry_delay(attempt)
+                if delay is None:
+                    raise
+            else:
+                self.record_outcome(response.status_code not in RETRY_STATUSES, started)
+                if response.ok:
+                    return response
+                delay = self.retry_delay(attempt, response.status_code, response.headers)
+                if delay is None:
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+    
+    def response_events(self, response):
+        """Raise for an error status, else iterate the response's events."""
+        response.raise_for_status()
+        if self.stream:
+            return self.iter_sse_events(response)
+        return iter([response.json()])
+    
+    @contextlib.contextmanager
+    def open_events(self, body, query_type="overview"):
+        """
+        Send the request (hedged when enabled) and yield its events, closing the response afterwards.
+        
+        The request holds a scheduler slot until its response is closed.
+        """
+        with self.scheduler.slot() if self.scheduler else contextlib.nullcontext():
+            if self.hedge is None:
+                with self.open_response(body, query_type) as response:
+                    yield self.response_events(response)
+                return
+            response, events = self.open_hedged(body, query_type)
+            with response:
+                yield events
+    
+    def open_hedged(self, body, query_type="overview"):
+        """
+        Send the request and, if its first event is later than usual, one duplicate.
+        
+        Returns the response and events of whichever attempt delivers its first
+        event first; the other attempt is closed. Errors only surface once every
+        attempt has failed.
+        
+        The duplicate takes its own scheduler slot, and is skipped if none is
+        free; the slot is returned once only one attempt is left open.
+        """
+        results = queue.Queue()
+        lock = threading.Lock()
+        state = {"winner": None, "responses": {}, "live": 1, "hedge_slot": False}
+        
+        def attempt_over():
+            with lock:
+                state["live"] -= 1
+                release = state["live"] <= 1 and state["hedge_slot"]
+                if release:
+                    state["hedge_slot"] = False
+            if release:
+                self.scheduler.release()
+        
+        def attempt(hedged):
+            started = time.perf_counter()
+            response = None
+            try:
+                response = self.open_response(body, query_type, acquire=not hedged)
+                with lock:
+                    state["responses"][hedged] = response
+                    lost = state["winner"] is not None
+                if lost:
+                    response.close()
+                    attempt_over()
+                    return
+                events = self.response_events(response)
+                first = next(events, None)
+            except Exception as e:
+                # An error status or a broken stream must still hand its connection back to the pool
+                if response is not None:
+                    with lock:
+                        state["responses"].pop(hedged, None)
+                    response.close()
+                attempt_over()
+                results.put((hedged, None, e))
+                return
+            with lock:
+                won = state["winner"] is None
+                if won:
+                    state["winner"] = hedged
+                    loser = state["responses"].get(not hedged)
+            if not won:
+                response.close()
+                attempt_over()
+                return
+            if loser is not None:
+                loser.close()
+            self.hedge.observe(query_type, time.perf_counter() - started)
+            events = itertools.chain([first], events) if first is not None else events
+            results.put((hedged, (response, events), None))
+        
+        threading.Thread(target=attempt, args=(False,), daemon=True).start()
+        attempts = 1
         try:
-            response = requests.post(self.base_url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            
-            content = data["choices"][0]["message"]["content"]
-            
-            # Yield content in chunks
-            chunk_size = 30
-            for i in range(0, len(content), chunk_size):
-                yield content[i:i+chunk_size]
-            
-            # Debug: show all keys in response
-            yield f"\n\n*[Debug: API keys: {list(data.keys())}]*"
-            
-            # Try different possible citation field names
-            citations = data.get("citations", []) or data.get("sources", []) or data.get("references", [])
-            
-            if citations:
-                yield "\n\n---\n\n**📚 Sources:**\n"
-                for i, url in enumerate(citations, 1):
-                    short_name = self.shorten_url(url)
-                    yield f"\n[{i}] [{short_name}]({url})"
+            result = results.get(timeout=self.hedge.delay(query_type))
+        except queue.Empty:
+            result = None
+            slot = self.scheduler is None or self.scheduler.try_acquire(*current_request_class())
+            if slot and self.hedge.try_hedge(self.rate_limiter):
+                with lock:
+                    state["live"] += 1
+                    state["hedge_slot"] = self.scheduler is not None
+                threading.Thread(target=attempt, args=(True,), daemon=True).start()
+                attempts = 2
             else:
-                yield "\n\n*[Debug: No citations found in response]*"
-            
-            yield MEDICAL_DISCLAIMER
-            
+                if slot and self.scheduler is not None:
+                    self.scheduler.release()
+                metrics.inc("hedge_requests_total", query_type=query_type, result="skipped")
+        self.hedge.record_request(attempts == 2)
+        
+        failures = 0
+        while True:
+            if result is None:
+                result = results.get()
+            hedged, opened, error = result
+            if opened is not None:
+                if attempts == 2:
+                    metrics.inc("hedge_requests_total", query_type=query_type, result="won" if hedged else "lost")
+                return opened
+            failures += 1
+            if failures == attempts:
+                raise error
+            result = None
+    
+    def stream_upstream(self, cache_key, payload, query_type="overview", citations=None):
+        """
+        Send one request upstream, yield its text deltas, cache the answer and return the citations.
+        
+        Pass `citations` to use a known source list instead of the one upstream returns.
+        """
+        started = time.perf_counter()
+        first_chunk = None
+        with self.open_events(self.encode_payload(payload, query_type), query_type) as events:
+            # Yield content deltas as they arrive; the last event carries citations.
+            # Past the word budget the answer ends at the next sentence boundary and
+            # the connection is closed instead of reading (and paying for) the rest.
+            data = {}
+            parts = []
+            cutoff = self.soft_cutoff(query_type)
+            for event in events:
+                data = event
+                content = cutoff.feed(self.event_content(event))
+                if content:
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter()
+                    parts.append(content)
+                    yield content
+                if cutoff.done:
+                    break
+            tail = cutoff.flush()
+            if tail:
+                parts.append(tail)
+                yield tail
+        
+        truncated = "soft" if cutoff.done else "max_tokens" if self.event_truncated(data) else None
+        self.record_answer(query_type, started, first_chunk, parts, truncated)
+        if citations is None:
+            citations = self.event_citations(data)
+        self.store_answer(cache_key, parts, citations)
+        return citations
+    
+    def answer(self, user_message, query_type="overview", compounds=None, conversation_history=None):
+        """Return the full answer text and its citations; upstream errors raise."""
+        result = {"citations": []}
+        
+        def collect():
+            result["citations"] = yield from self.stream_answer(user_message, query_type, compounds, conversation_history)
+        
+        result["content"] = "".join(collect())
+        return result
+    
+    def refresh_answer(self, user_message, query_type="overview", compounds=None):
+        """Generate a standalone answer upstream, bypassing and then overwriting its cache entry."""
+        compounds = compounds or []
+        cache_key = self.cache_key(query_type, compounds, user_message)
+        if self.similar is not None:
+            self.similar.add(query_type, compounds, user_message, cache_key)
+        payload = self.build_payload(user_message, query_type, compounds)
+        result = {"citations": []}
+        
+        def collect():
+            result["citations"] = yield from self.stream_upstream(cache_key, payload, query_type)
+        
+        result["content"] = "".join(collect())
+        result["cache_key"] = cache_key
+        return result
+    
+    def stream_query(self, user_message, query_type="overview", compounds=None, conversation_history=None):
+        """Query Perplexity and return response with citations."""
+        try:
+            citations = yield from self.stream_answer(user_message, query_type, compounds, conversation_history)
+            yield from self.iter_sources(citations)
         except Exception as e:
             yield f"\n\nError: {str(e)}"
 
 
+def get_client(api_key=None):
+    """Return the process-wide client for an API key, creating it on first use."""
+    key = api_key or PERPLEXITY_API_KEY
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = PerplexityClient(key, cache=get_answer_cache(), rate_limiter=get_rate_limiter(),
+                                      breaker=get_circuit_breaker(), hedge=get_hedge_policy(),
+                                      scheduler=get_scheduler(), similar=get_similar_index())
+            _clients[key] = client
+        return client
+
+
 def ask_evidencelab(question, query_type="overview"):
-    client = PerplexityClient()
+    client = get_client()
     from utils.query_classifier import classify_query
     detected_type, compounds, confidence = classify_query(question)
     final_type = query_type if query_type != "overview" else detected_type
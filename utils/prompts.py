@@ -2,6 +2,8 @@
 EvidenceLab Prompt Templates
 Based on research into Reddit, wellness clinics, and Google search patterns
 """
+import hashlib
+from string import Formatter
 
 SYSTEM_PROMPT = """You are EvidenceLab, an evidence-based health research assistant specializing in peptides, hormones, and therapeutic compounds.
 
@@ -51,13 +53,9 @@ You must include appropriate disclaimers:
 """
 
 
-def get_query_prompt(query_type: str, user_query: str, compounds: list[str]) -> str:
-    """Generate the appropriate prompt based on query type."""
-    
-    compound_str = ", ".join(compounds) if compounds else "the compound mentioned"
-    
-    prompts = {
-        "overview": f"""Provide a comprehensive overview of {compound_str}.
+# Query templates; {compound_str} and {user_query} are filled in by PromptTemplate.render
+QUERY_TEMPLATES = {
+    "overview": """Provide a comprehensive overview of {compound_str}.
 
 User's question: {user_query}
 
@@ -72,7 +70,7 @@ Structure your response (200-250 words):
 End with: "Discuss with your healthcare provider to see if this is appropriate for your situation."
 """,
 
-        "tldr": f"""Give a TLDR summary of {compound_str}.
+    "tldr": """Give a TLDR summary of {compound_str}.
 
 User's question: {user_query}
 
@@ -90,7 +88,7 @@ Structure (150-200 words total, answering ALL 8 questions):
 Be direct and specific. Use numbers. No fluff.
 """,
 
-        "dosage": f"""Provide dosing information for {compound_str}.
+    "dosage": """Provide dosing information for {compound_str}.
 
 User's question: {user_query}
 
@@ -106,7 +104,7 @@ Note: "Optimal dosing should be determined with your healthcare provider based o
 Be specific with numbers. Don't hedge unnecessarily.
 """,
 
-        "timeline": f"""Explain the results timeline for {compound_str}.
+    "timeline": """Explain the results timeline for {compound_str}.
 
 User's question: {user_query}
 
@@ -120,7 +118,7 @@ Structure (50-70 words):
 Be realistic but encouraging. Use specific timeframes, not vague language.
 """,
 
-        "benefits": f"""Explain the benefits of {compound_str}.
+    "benefits": """Explain the benefits of {compound_str}.
 
 User's question: {user_query}
 
@@ -138,7 +136,7 @@ Focus on measurable, practical outcomes people care about:
 Don't oversell. Indicate evidence strength for each benefit.
 """,
 
-        "side_effects": f"""Explain the side effects of {compound_str}.
+    "side_effects": """Explain the side effects of {compound_str}.
 
 User's question: {user_query}
 
@@ -153,7 +151,7 @@ Structure (55-75 words):
 Be honest without being alarmist. Include frequency data when available.
 """,
 
-        "safety": f"""Provide safety information for {compound_str}.
+    "safety": """Provide safety information for {compound_str}.
 
 User's question: {user_query}
 
@@ -169,7 +167,7 @@ Structure (60-80 words):
 Be thorough but not fear-mongering.
 """,
 
-        "comparison": f"""Compare the compounds mentioned.
+    "comparison": """Compare the compounds mentioned.
 
 User's question: {user_query}
 
@@ -195,7 +193,22 @@ Create a clear comparison:
 Be objective. Don't push one over the other unless evidence clearly supports it.
 """,
 
-        "how_to": f"""Provide usage instructions for {compound_str}.
+    "profile": """Write a compact reference profile of {compound_str} for side-by-side comparisons.
+
+Structure (100-140 words), one or two short lines each:
+
+**Primary Use**:
+**Mechanism**:
+**Typical Dosing**:
+**Timeline**:
+**Side Effects**:
+**Evidence Quality**: [Strong / Moderate / Weak / Preliminary]
+**Cost/Availability**:
+
+Facts only, with citations. No recommendations and no disclaimer.
+""",
+
+    "how_to": """Provide usage instructions for {compound_str}.
 
 User's question: {user_query}
 
@@ -219,7 +232,7 @@ Structure (80-120 words):
 Be precise and practical. This is where users need exact details.
 """,
 
-        "evidence": f"""Evaluate the research evidence for {compound_str}.
+    "evidence": """Evaluate the research evidence for {compound_str}.
 
 User's question: {user_query}
 
@@ -242,9 +255,136 @@ Structure (75-100 words):
 
 Be scientifically honest. Many peptides have limited human data - say so clearly.
 """,
-    }
-    
-    return prompts.get(query_type, prompts["overview"])
+
+    "comparison_merge": """Compare {compound_list} using ONLY the reference profiles below.
+Keep the [n] source numbers exactly as given and do not add new sources.
+
+User's question: {user_query}
+
+{profile_blocks}
+
+Structure (110-150 words):
+
+**{title} Comparison**
+
+| Factor | {columns} |
+|{divider}|
+| Primary Use | |
+| Mechanism | |
+| Timeline | |
+| Side Effects | |
+| Evidence Quality | |
+| Cost/Availability | |
+
+{choose}
+**Can They Be Combined?**: Yes/No and why
+
+Be objective. Don't push one over the other unless evidence clearly supports it.
+""",
+}
+
+# Appended to every query prompt so the model always sees the literal question
+QUESTION_SUFFIX = "\n\n---\nOriginal question: {user_query}"
+
+CHARS_PER_TOKEN = 4  # Rough estimate for English prose and markdown
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+class PromptTemplate:
+    """
+    A template parsed once into literal segments and field names.
+
+    render() only joins strings, and the token count of the literal text is
+    known before any request is built.
+    """
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.segments = [(literal, field) for literal, field, _, _ in Formatter().parse(text)]
+        self.fields = {field for _, field in self.segments if field}
+        self.static_tokens = estimate_tokens("".join(literal for literal, _ in self.segments))
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+
+    def render(self, **values) -> str:
+        parts = []
+        for literal, field in self.segments:
+            parts.append(literal)
+            if field:
+                parts.append(values[field])
+        return "".join(parts)
+
+    def token_count(self, **values) -> int:
+        """Estimated tokens of the rendered prompt, without rendering it."""
+        return self.static_tokens + sum(estimate_tokens(values.get(field, "")) for field in self.fields)
+
+
+class PromptRegistry:
+    """Templates indexed by query type, with per-type versions for cache invalidation."""
+
+    def __init__(self, system_prompt: str, templates: dict[str, str], fallback: str = "overview"):
+        self.system_prompt = system_prompt
+        self.templates = {name: PromptTemplate(name, text) for name, text in templates.items()}
+        self.fallback = fallback
+        self.question_suffix = PromptTemplate("question_suffix", QUESTION_SUFFIX)
+        # Full user messages (template + suffix) compiled once, so rendering one is a single join
+        self._queries = {name: PromptTemplate(name, text + QUESTION_SUFFIX) for name, text in templates.items()}
+        self.system_tokens = estimate_tokens(system_prompt)
+        self._versions = {}
+
+    def get(self, query_type: str) -> PromptTemplate:
+        return self.templates.get(query_type) or self.templates[self.fallback]
+
+    def render(self, query_type: str, user_query: str, compounds: list[str]) -> str:
+        """The user message for a query: its template followed by the original question."""
+        compound_str = ", ".join(compounds) if compounds else "the compound mentioned"
+        template = self._queries.get(query_type) or self._queries[self.fallback]
+        return template.render(compound_str=compound_str, user_query=user_query)
+
+    def version(self, query_type: str) -> str:
+        """
+        Short hash of everything that shapes a query type's answer: the system
+        prompt, its template and any helper templates named "<type>_*" (e.g.
+        comparison_merge). Changing any of them changes the answers' cache keys.
+        """
+        version = self._versions.get(query_type)
+        if version is None:
+            template = self.get(query_type)
+            parts = [self.system_prompt, self.question_suffix.text, template.text] + [
+                t.text for name, t in sorted(self.templates.items()) if name.startswith(template.name + "_")
+            ]
+            version = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:12]
+            self._versions[query_type] = version
+        return version
+
+    def token_counts(self) -> dict[str, int]:
+        """Estimated fixed tokens (system prompt + template) per query type."""
+        return {name: self.system_tokens + t.static_tokens for name, t in self.templates.items()}
+
+
+PROMPTS = PromptRegistry(SYSTEM_PROMPT, QUERY_TEMPLATES)
+
+
+def get_query_prompt(query_type: str, user_query: str, compounds: list[str]) -> str:
+    """Generate the appropriate prompt based on query type."""
+    compound_str = ", ".join(compounds) if compounds else "the compound mentioned"
+    return PROMPTS.get(query_type).render(compound_str=compound_str, user_query=user_query)
+
+
+def get_comparison_merge_prompt(user_query: str, compounds: list[str], profiles: list[str]) -> str:
+    """Prompt that merges per-compound profiles (one per compound, same order) into a comparison."""
+    return PROMPTS.templates["comparison_merge"].render(
+        compound_list=", ".join(compounds),
+        user_query=user_query,
+        profile_blocks="\n\n".join(f"### {compound}\n{profile}" for compound, profile in zip(compounds, profiles)),
+        title=" vs ".join(compounds),
+        columns=" | ".join(compounds),
+        divider="|".join(["--------"] * (len(compounds) + 1)),
+        choose="\n".join(f"**When to Choose {compound}**: Specific scenarios" for compound in compounds),
+    )
 
 
 MEDICAL_DISCLAIMER = """
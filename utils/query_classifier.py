@@ -1,9 +1,17 @@
 """
 Query Classifier - Detects user intent and routes to appropriate response type
 """
+import logging
 import re
-from typing import Literal, Tuple
-from config import COMPOUND_CATEGORIES
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, Literal, Optional, Tuple
+from config import COMPOUND_CATEGORIES, COMPOUND_ALIASES, COMPOUND_FUZZY_MATCHING
+from utils.compound_matcher import CompoundMatcher
+
+logger = logging.getLogger(__name__)
 
 QueryType = Literal[
     "overview", "dosage", "timeline", "benefits", "side_effects",
@@ -58,23 +66,98 @@ QUERY_PATTERNS = {
     ],
 }
 
+# Priority order for breaking score ties (some patterns can overlap)
+PRIORITY_ORDER = [
+    "tldr", "side_effects", "dosage", "timeline", "comparison",
+    "how_to", "evidence", "safety", "benefits"
+]
 
-def extract_compounds(query: str) -> list[str]:
-    """Extract compound names mentioned in the query."""
-    query_lower = query.lower()
-    found = []
-    
-    all_compounds = []
-    for category_compounds in COMPOUND_CATEGORIES.values():
-        all_compounds.extend(category_compounds)
+_TOKEN_RE = re.compile(r"\w+")
+_PURE_WORD_RE = re.compile(r"\\b([a-z]+)\\b")
+_LEADING_WORD_RE = re.compile(r"\\b([a-z]+)([?*{]?)")
+
+
+def _leading_word(pattern: str):
+    """Literal word every match of the pattern must start with, or None if there isn't one."""
+    if "|" in re.sub(r"\([^()]*\)", "", pattern):
+        return None
+    match = _LEADING_WORD_RE.match(pattern)
+    if not match:
+        return None
+    word, quantifier = match.groups()
+    if quantifier:
+        word = word[:-1]
+    return word or None
+
+
+def _build_intent_index(query_patterns: dict) -> dict:
+    """Index every intent pattern by the word a match has to start at."""
+    index = {"exact": {}, "prefix": {}, "prefix_lengths": set(), "unanchored": []}
+    for query_type, patterns in query_patterns.items():
+        for pattern in patterns:
+            pure = _PURE_WORD_RE.fullmatch(pattern)
+            if pure:
+                index["exact"].setdefault(pure.group(1), []).append(query_type)
+                continue
+            rule = (query_type, re.compile(pattern))
+            word = _leading_word(pattern)
+            if word is None:
+                index["unanchored"].append(rule)
+            else:
+                index["prefix"].setdefault(word, []).append(rule)
+                index["prefix_lengths"].add(len(word))
+    index["prefix_lengths"] = sorted(index["prefix_lengths"])
+    return index
+
+
+# Built once at import: a token index over QUERY_PATTERNS
+_INTENT_INDEX = _build_intent_index(QUERY_PATTERNS)
+
+
+def score_query_types(query_lower: str) -> dict:
+    """Count matching QUERY_PATTERNS per query type from one tokenization of the query."""
+    scores = dict.fromkeys(QUERY_PATTERNS, 0)
+    exact, prefix = _INTENT_INDEX["exact"], _INTENT_INDEX["prefix"]
+    lengths = _INTENT_INDEX["prefix_lengths"]
     
-    for compound in all_compounds:
-        # Create flexible pattern for compound names
-        pattern = compound.lower().replace("-", r"[\s\-]?").replace(" ", r"[\s\-]?")
-        if re.search(pattern, query_lower):
-            found.append(compound)
+    candidates = set()
+    for token in set(_TOKEN_RE.findall(query_lower)):
+        for query_type in exact.get(token, ()):
+            scores[query_type] += 1
+        for length in lengths:
+            if length > len(token):
+                break
+            for rule in prefix.get(token[:length], ()):
+                candidates.add(rule)
     
-    return found
+    # Only patterns whose leading word appears in the query need a full regex check
+    for query_type, regex in list(candidates) + _INTENT_INDEX["unanchored"]:
+        if regex.search(query_lower):
+            scores[query_type] += 1
+    return scores
+
+
+# Built once at import: one automaton over every compound name, alias and hyphen/space variant
+_COMPOUND_MATCHER = CompoundMatcher(
+    (compound for category_compounds in COMPOUND_CATEGORIES.values() for compound in category_compounds),
+    aliases=COMPOUND_ALIASES,
+    fuzzy=COMPOUND_FUZZY_MATCHING
+)
+
+
+def extract_compounds(query: str) -> list[str]:
+    """Extract compound names mentioned in the query."""
+    return _COMPOUND_MATCHER.extract(query.lower())
+
+
+def find_compounds(query: str) -> list[tuple[str, int, int]]:
+    """Locate compound mentions as (name, start, end) spans of the lowercased query."""
+    return _COMPOUND_MATCHER.find(query.lower())
+
+
+def score_compounds(query: str) -> dict:
+    """Canonical compound names mentioned in the query with match scores (1.0 exact or alias, lower for misspellings)."""
+    return _COMPOUND_MATCHER.scores(query.lower())
 
 
 def classify_query(query: str) -> Tuple[QueryType, list[str], float]:
@@ -89,26 +172,14 @@ def classify_query(query: str) -> Tuple[QueryType, list[str], float]:
     # Extract compounds mentioned
     compounds = extract_compounds(query)
     
-    # Priority order for checking (some patterns can overlap)
-    priority_order = [
-        "tldr", "side_effects", "dosage", "timeline", "comparison",
-        "how_to", "evidence", "safety", "benefits"
-    ]
-    
     # Score each query type
-    scores = {}
-    for query_type, patterns in QUERY_PATTERNS.items():
-        score = 0
-        for pattern in patterns:
-            if re.search(pattern, query_lower, re.IGNORECASE):
-                score += 1
-        scores[query_type] = score
+    scores = score_query_types(query_lower)
     
     # Find best match respecting priority for ties
     best_type = "overview"
     best_score = 0
     
-    for query_type in priority_order:
+    for query_type in PRIORITY_ORDER:
         if scores.get(query_type, 0) > best_score:
             best_type = query_type
             best_score = scores[query_type]
@@ -123,6 +194,84 @@ def classify_query(query: str) -> Tuple[QueryType, list[str], float]:
     return best_type, compounds, confidence
 
 
+def _classify_chunk(queries: list[str]) -> list[Tuple[QueryType, list[str], float]]:
+    """Process-pool worker: classify one chunk of queries."""
+    return [classify_query(query) for query in queries]
+
+
+def classify_queries(
+    queries: Iterable[str],
+    memo_size: int = 100_000,
+    processes: Optional[int] = None,
+    chunk_size: int = 2_000,
+    stats: Optional[dict] = None,
+) -> Iterator[Tuple[QueryType, list[str], float]]:
+    """
+    Classify many queries, yielding results in input order as they are ready.
+    
+    Repeated questions are answered from a bounded LRU memo. With processes set,
+    chunks of unseen questions are classified on a process pool, keeping at most
+    two chunks per worker in flight. Throughput is logged at the end and written
+    into stats if a dict is given.
+    """
+    memo = OrderedDict()
+    counts = {"queries": 0, "memo_hits": 0, "classified": 0}
+    started = time.perf_counter()
+    
+    def split(chunk):
+        keys = [query.lower().strip() for query in chunk]
+        known = {}
+        for key in keys:
+            if key in memo:
+                memo.move_to_end(key)
+                known[key] = memo[key]
+        misses = list(dict.fromkeys(key for key in keys if key not in known))
+        counts["queries"] += len(keys)
+        counts["memo_hits"] += len(keys) - len(misses)
+        counts["classified"] += len(misses)
+        return keys, known, misses
+    
+    def resolve(keys, known, misses, results):
+        for key, result in zip(misses, results):
+            known[key] = result
+            memo[key] = result
+            if len(memo) > memo_size:
+                memo.popitem(last=False)
+        for key in keys:
+            query_type, compounds, confidence = known[key]
+            yield query_type, list(compounds), confidence
+    
+    iterator = iter(queries)
+    chunks = iter(lambda: list(islice(iterator, chunk_size)), [])
+    try:
+        if not processes:
+            for chunk in chunks:
+                keys, known, misses = split(chunk)
+                yield from resolve(keys, known, misses, _classify_chunk(misses))
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    keys, known, misses = split(chunk)
+                    pending.append((keys, known, misses, pool.submit(_classify_chunk, misses)))
+                    while len(pending) >= processes * 2:
+                        keys, known, misses, future = pending.popleft()
+                        yield from resolve(keys, known, misses, future.result())
+                while pending:
+                    keys, known, misses, future = pending.popleft()
+                    yield from resolve(keys, known, misses, future.result())
+    finally:
+        elapsed = time.perf_counter() - started
+        counts["seconds"] = elapsed
+        counts["queries_per_second"] = counts["queries"] / elapsed if elapsed else 0.0
+        if stats is not None:
+            stats.update(counts)
+        logger.info(
+            "Classified %d queries (%d memo hits) in %.2fs: %.0f queries/s",
+            counts["queries"], counts["memo_hits"], elapsed, counts["queries_per_second"]
+        )
+
+
 def get_query_context(query_type: QueryType) -> dict:
     """Get context info for the query type."""
     contexts = {
@@ -0,0 +1,291 @@
+"""
+Resilience - Retry backoff, rate limiting, circuit breaking and hedging for upstream calls
+
+The token bucket is per process. When several processes share one API key,
+RATE_LIMIT_PROCESSES gives each an equal share of the quota.
+"""
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from config import (
+    RATE_LIMIT_REQUESTS_PER_MINUTE, RATE_LIMIT_BURST, RATE_LIMIT_MAX_WAIT, RATE_LIMIT_PROCESSES,
+    RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX,
+    BREAKER_ENABLED, BREAKER_WINDOW_SECONDS, BREAKER_MIN_REQUESTS, BREAKER_FAILURE_RATE,
+    BREAKER_SLOW_SECONDS, BREAKER_OPEN_SECONDS,
+    HEDGE_ENABLED, HEDGE_QUANTILE, HEDGE_MIN_SAMPLES, HEDGE_INITIAL_DELAY, HEDGE_MIN_DELAY, HEDGE_MAX_RATE, HEDGE_WINDOW
+)
+from utils.metrics import metrics
+
+# Upstream statuses worth retrying: rate limited or transiently unavailable
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request would have to queue longer than the limiter allows."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Callers reserve a token and sleep until it is theirs, so waiting requests are
+    served in arrival order and never burst past the configured rate.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float, max_wait: Optional[float] = None):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait: Optional[float] = None) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                raise RateLimitExceeded(f"Rate limit queue is {wait:.1f}s deep (max {max_wait:.1f}s)")
+            self.tokens -= 1
+            return wait
+
+    def acquire(self, max_wait: Optional[float] = None):
+        """Block until a token is available."""
+        wait = self.reserve(max_wait)
+        if wait:
+            time.sleep(wait)
+
+    def available(self) -> float:
+        """Tokens available right now, without taking one."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available right now."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker over a rolling window of upstream outcomes.
+
+    Errors and calls slower than `slow_seconds` both count as failures. Once
+    the window holds at least `min_requests` outcomes and the failure rate
+    reaches `failure_rate`, the breaker opens and allow() returns False. After
+    `open_seconds` it lets one probe through (half-open); the probe's outcome
+    closes the breaker or re-opens it for another `open_seconds`.
+    """
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, window_seconds: float = BREAKER_WINDOW_SECONDS, min_requests: int = BREAKER_MIN_REQUESTS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, slow_seconds: float = BREAKER_SLOW_SECONDS,
+                 open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probe_started = None
+        self.outcomes = deque()  # (monotonic time, failed)
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may go upstream now; in half-open state only the single probe may."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and now - self.opened_at < self.open_seconds:
+                metrics.inc("circuit_rejections_total")
+                return False
+            # Cool-down over: admit one probe; a probe that never reported is replaced after open_seconds
+            if self.probe_started is None or now - self.probe_started >= self.open_seconds:
+                self._set_state(self.HALF_OPEN)
+                self.probe_started = now
+                return True
+            metrics.inc("circuit_rejections_total")
+            return False
+
+    def record(self, ok: bool, latency: float = 0.0):
+        """Report one upstream outcome; latency is seconds to the response headers."""
+        failed = not ok or latency >= self.slow_seconds
+        with self._lock:
+            now = time.monotonic()
+            if self.state != self.CLOSED:
+                if self.probe_started is not None:
+                    self.probe_started = None
+                    if failed:
+                        self._open(now)
+                    else:
+                        self.outcomes.clear()
+                        self.failures = 0
+                        self._set_state(self.CLOSED)
+                return
+            self.outcomes.append((now, failed))
+            self.failures += failed
+            while self.outcomes and now - self.outcomes[0][0] > self.window_seconds:
+                self.failures -= self.outcomes.popleft()[1]
+            if len(self.outcomes) >= self.min_requests and self.failures / len(self.outcomes) >= self.failure_rate:
+                self._open(now)
+
+    def _open(self, now: float):
+        self.opened_at = now
+        self._set_state(self.OPEN)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            metrics.inc("circuit_transitions_total", to=state)
+        self.state = state
+        metrics.set_gauge("circuit_open", 0 if state == self.CLOSED else 1)
+
+
+class HedgePolicy:
+    """
+    Decides when to send a duplicate (hedge) request and whether one is affordable.
+
+    The delay is the `quantile` of recently observed time-to-first-byte for the
+    query type, so roughly 1 - quantile of requests are candidates. A hedge is
+    only sent while hedges stay under `max_rate` of recent requests and a rate
+    limiter token is free right now; it never queues behind user requests.
+    """
+
+    def __init__(self, quantile: float = HEDGE_QUANTILE, min_samples: int = HEDGE_MIN_SAMPLES,
+                 initial_delay: float = HEDGE_INITIAL_DELAY, min_delay: float = HEDGE_MIN_DELAY,
+                 max_rate: float = HEDGE_MAX_RATE, window: int = HEDGE_WINDOW):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.window = window
+        self.samples = {}  # query_type -> deque of recent time-to-first-byte
+        self.recent = deque(maxlen=window)  # Whether each recent request was hedged
+        self._lock = threading.Lock()
+
+    def observe(self, query_type: str, seconds: float):
+        with self._lock:
+            samples = self.samples.get(query_type)
+            if samples is None:
+                samples = self.samples[query_type] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def delay(self, query_type: str) -> float:
+        """Seconds to wait for the first byte before hedging."""
+        with self._lock:
+            samples = sorted(self.samples.get(query_type, ()))
+        if len(samples) < self.min_samples:
+            delay = self.initial_delay
+        else:
+            delay = max(self.min_delay, samples[min(len(samples) - 1, int(self.quantile * len(samples)))])
+        metrics.set_gauge("hedge_delay_seconds", delay, query_type=query_type)
+        return delay
+
+    def record_request(self, hedged: bool):
+        with self._lock:
+            self.recent.append(hedged)
+
+    def try_hedge(self, rate_limiter=None) -> bool:
+        """Whether to hedge now; takes a limiter token when it says yes."""
+        with self._lock:
+            if self.recent and sum(self.recent) + 1 > self.max_rate * max(len(self.recent), self.window):
+                return False
+        return rate_limiter is None or rate_limiter.try_acquire()
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None,
+                  base: float = RETRY_BACKOFF_BASE, cap: float = RETRY_BACKOFF_MAX) -> Optional[float]:
+    """
+    Full-jitter exponential backoff, never shorter than the server's Retry-After.
+
+    Returns None, so the caller gives up, when Retry-After asks for longer than
+    `cap`: a user is waiting, and retrying sooner would only be refused again.
+    """
+    if retry_after is not None and retry_after > cap:
+        return None
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Process-wide limiter sized to this process's share of the API quota, or None when disabled."""
+    global _rate_limiter
+    if RATE_LIMIT_REQUESTS_PER_MINUTE <= 0:
+        return None
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            processes = max(1, RATE_LIMIT_PROCESSES)
+            _rate_limiter = TokenBucket(RATE_LIMIT_REQUESTS_PER_MINUTE / 60.0 / processes,
+                                        max(1.0, RATE_LIMIT_BURST / processes), RATE_LIMIT_MAX_WAIT)
+        return _rate_limiter
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """Process-wide breaker shared by every client, or None when disabled."""
+    global _breaker
+    if not BREAKER_ENABLED:
+        return None
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker()
+        return _breaker
+
+
+_hedge = None
+_hedge_lock = threading.Lock()
+
+
+def get_hedge_policy():
+    """Process-wide hedging policy, or None when hedging is disabled."""
+    global _hedge
+    if not HEDGE_ENABLED:
+        return None
+    with _hedge_lock:
+        if _hedge is None:
+            _hedge = HedgePolicy()
+        return _hedge
@@ -0,0 +1,222 @@
+"""
+Scheduler - Fair, priority-aware admission for upstream requests
+
+Every upstream request takes a slot before it is sent. At most
+SCHEDULER_MAX_IN_FLIGHT are in flight per process. Waiting requests are served
+by priority class first (Quick Lookup, then chat, then warm-up and batch). Within
+a class, sessions take turns, so one busy session cannot starve the others.
+Background work never holds the last SCHEDULER_RESERVED_SLOTS, so interactive
+requests do not queue behind a batch job. Background work also waits as long as
+it takes; only interactive and chat requests give up after SCHEDULER_MAX_WAIT.
+"""
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+from config import SCHEDULER_ENABLED, SCHEDULER_MAX_IN_FLIGHT, SCHEDULER_RESERVED_SLOTS, SCHEDULER_MAX_WAIT
+from utils.metrics import metrics
+
+# Highest priority first
+PRIORITIES = ("interactive", "chat", "background")
+
+_request_class = contextvars.ContextVar("request_class", default=("chat", None))
+
+
+class SchedulerBusy(Exception):
+    """Raised when a request waited longer than the scheduler allows."""
+
+
+@contextlib.contextmanager
+def request_class(priority: str, session: Optional[str] = None):
+    """Run upstream requests made in this context with the given priority, on behalf of `session`."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}'")
+    token = _request_class.set((priority, session))
+    try:
+        yield
+    finally:
+        _request_class.reset(token)
+
+
+def current_request_class() -> tuple:
+    return _request_class.get()
+
+
+class _Waiter:
+    def __init__(self, priority, wake):
+        self.priority = priority
+        self.wake = wake
+        self.granted = False
+
+
+class FairScheduler:
+    """
+    Caps in-flight upstream requests and orders the ones waiting.
+
+    Each priority class holds an ordered map of session -> waiting requests.
+    A free slot goes to the highest class with waiters; within it the first
+    session in the map is served and moved to the back if it has more waiting.
+    """
+
+    def __init__(self, max_in_flight: int = SCHEDULER_MAX_IN_FLIGHT, reserved: int = SCHEDULER_RESERVED_SLOTS,
+                 max_wait: Optional[float] = SCHEDULER_MAX_WAIT):
+        self.max_in_flight = max_in_flight
+        self.reserved = min(reserved, max_in_flight - 1)
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._lock = threading.Lock()
+
+    def queue_depth(self, priority: Optional[str] = None) -> int:
+        with self._lock:
+            return self._depth(priority)
+
+    def _depth(self, priority=None):
+        priorities = PRIORITIES if priority is None else (priority,)
+        return sum(len(waiters) for p in priorities for waiters in self._queues[p].values())
+
+    def capacity(self, priority: str) -> int:
+        """Most slots requests of this class can hold at once."""
+        return self.max_in_flight - (self.reserved if priority == "background" else 0)
+
+    def _has_room(self, priority):
+        return self.in_flight < self.capacity(priority)
+
+    def _take_free(self, priority):
+        """Take a slot if one is free and nothing of equal or higher priority is waiting. Called with the lock held."""
+        ahead = PRIORITIES[:PRIORITIES.index(priority) + 1]
+        if self._has_room(priority) and not any(self._queues[p] for p in ahead):
+            self.in_flight += 1
+            return True
+        return False
+
+    def _admit(self, priority, session, wake):
+        """Take a slot now if one is free, else queue; returns the waiter."""
+        waiter = _Waiter(priority, wake)
+        if self._take_free(priority):
+            waiter.granted = True
+        else:
+            self._queues[priority].setdefault(session, deque()).append(waiter)
+            metrics.set_gauge("scheduler_queue_depth", self._depth(priority), priority=priority)
+        metrics.set_gauge("scheduler_in_flight", self.in_flight)
+        return waiter
+
+    def _dispatch(self):
+        """Hand free slots to waiters in priority, then round-robin session, order. Called with the lock held."""
+        for priority in PRIORITIES:
+            sessions = self._queues[priority]
+            while sessions and self._has_room(priority):
+                session, waiters = next(iter(sessions.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    sessions.move_to_end(session)
+                else:
+                    del sessions[session]
+                self.in_flight += 1
+                waiter.granted = True
+                waiter.wake()
+            metrics.set_gauge("scheduler_queue_depth", self._depth(priority), priority=priority)
+            if sessions:
+                break  # Lower classes wait until this one drains
+        metrics.set_gauge("scheduler_in_flight", self.in_flight)
+
+    def _abandon(self, waiter, session):
+        """Withdraw a waiter that timed out or was cancelled; returns True if it had been granted a slot meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiters = self._queues[waiter.priority].get(session)
+            if waiters is not None:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._queues[waiter.priority][session]
+            metrics.set_gauge("scheduler_queue_depth", self._depth(waiter.priority), priority=waiter.priority)
+            return False
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def _max_wait(self, priority):
+        return None if priority == "background" else self.max_wait
+
+    def try_acquire(self, priority: str = "chat", session: Optional[str] = None) -> bool:
+        """Take a slot only if one is free right now, without queueing; for optional work such as hedges."""
+        with self._lock:
+            taken = self._take_free(priority)
+            metrics.set_gauge("scheduler_in_flight", self.in_flight)
+        return taken
+
+    def acquire(self, priority: str = "chat", session: Optional[str] = None):
+        """Block until a slot is granted; raises SchedulerBusy after max_wait unless the request is background work."""
+        started = time.perf_counter()
+        event = threading.Event()
+        with self._lock:
+            waiter = self._admit(priority, session, event.set)
+        if not waiter.granted and not event.wait(self._max_wait(priority)):
+            if not self._abandon(waiter, session):
+                metrics.inc("scheduler_rejections_total", priority=priority)
+                raise SchedulerBusy("The research service is busy. Please try again shortly.")
+        metrics.observe("scheduler_wait_seconds", time.perf_counter() - started, priority=priority)
+
+    async def aacquire(self, priority: str = "chat", session: Optional[str] = None):
+        """Async acquire; the slot may be granted from any thread, so the wake-up is scheduled on this loop."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        with self._lock:
+            waiter = self._admit(priority, session, wake)
+        if not waiter.granted:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self._max_wait(priority))
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter, session):
+                    metrics.inc("scheduler_rejections_total", priority=priority)
+                    raise SchedulerBusy("The research service is busy. Please try again shortly.") from None
+            except BaseException:
+                if self._abandon(waiter, session):
+                    self.release()  # Cancelled just after the grant
+                raise
+        metrics.observe("scheduler_wait_seconds", time.perf_counter() - started, priority=priority)
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Hold one in-flight slot for the current request class."""
+        priority, session = current_request_class()
+        self.acquire(priority, session)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def aslot(self):
+        priority, session = current_request_class()
+        await self.aacquire(priority, session)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler, or None when scheduling is disabled."""
+    global _default_scheduler
+    if not SCHEDULER_ENABLED:
+        return None
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = FairScheduler()
+        return _default_scheduler
@@ -0,0 +1,184 @@
+"""
+Session Store - Chat transcripts kept outside server memory (SQLite by default)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+from config import SESSION_STORE, SESSION_DB_PATH
+from utils.conversation import SOURCES_MARKER
+from utils.prompts import MEDICAL_DISCLAIMER
+
+FRAGMENT_CACHE_SIZE = 64  # The disclaimer plus recently shown source lists
+
+
+def split_tail(content: str) -> tuple[str, list[str]]:
+    """
+    Split a rendered answer into its own text and the boilerplate tail pieces
+    (sources list, medical disclaimer) that many answers repeat verbatim.
+    """
+    fragments = []
+    if content.endswith(MEDICAL_DISCLAIMER):
+        content = content[:-len(MEDICAL_DISCLAIMER)]
+        fragments.append(MEDICAL_DISCLAIMER)
+    index = content.find(SOURCES_MARKER)
+    if index != -1:
+        fragments.insert(0, content[index:])
+        content = content[:index]
+    return content, fragments
+
+
+def fragment_id(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class MemorySessionStore:
+    """In-process store with the same interface, for development and tests."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def append(self, session_id: str, message: dict) -> int:
+        with self._lock:
+            messages = self._sessions.setdefault(session_id, [])
+            messages.append({**message, "seq": len(messages)})
+            return len(messages) - 1
+
+    def count(self, session_id: str) -> int:
+        return len(self._sessions.get(session_id, []))
+
+    def page(self, session_id: str, before: Optional[int] = None, limit: int = 20) -> list[dict]:
+        """Up to `limit` messages older than seq `before` (or the newest), oldest first."""
+        messages = self._sessions.get(session_id, [])
+        end = len(messages) if before is None else max(0, before)
+        return [dict(m) for m in messages[max(0, end - limit):end]]
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    """
+    On-disk store. Each message keeps only its own text; the sources list and
+    disclaimer it ends with are stored once in a shared fragments table and
+    referenced by id. Fragments count their references and are deleted with
+    the last message that uses them.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                body TEXT NOT NULL,
+                fragments TEXT NOT NULL,
+                metadata TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            )"""
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fragments (id TEXT PRIMARY KEY, text TEXT NOT NULL, refs INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(fragments)")]
+        if "refs" not in columns:
+            # Stores created before fragments were reference-counted
+            self._conn.execute("ALTER TABLE fragments ADD COLUMN refs INTEGER NOT NULL DEFAULT 0")
+            counts = Counter(fid for (ids,) in self._conn.execute("SELECT fragments FROM messages")
+                             for fid in ids.split(",") if fid)
+            self._conn.executemany("UPDATE fragments SET refs = ? WHERE id = ?", [(n, fid) for fid, n in counts.items()])
+            self._conn.execute("DELETE FROM fragments WHERE refs = 0")
+        self._conn.commit()
+        self._fragments = OrderedDict()  # id -> text, least recently used first; source lists vary per answer
+
+    def append(self, session_id: str, message: dict) -> int:
+        body, fragments = split_tail(message["content"])
+        ids = [fragment_id(text) for text in fragments]
+        metadata = json.dumps(message["metadata"]) if message.get("metadata") else None
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO fragments (id, text, refs) VALUES (?, ?, 1) ON CONFLICT (id) DO UPDATE SET refs = refs + 1",
+                list(zip(ids, fragments))
+            )
+            (seq,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT INTO messages (session_id, seq, role, body, fragments, metadata, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, seq, message["role"], body, ",".join(ids), metadata, time.time())
+            )
+            self._conn.commit()
+        return seq
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+        return count
+
+    def page(self, session_id: str, before: Optional[int] = None, limit: int = 20) -> list[dict]:
+        """Up to `limit` messages older than seq `before` (or the newest), oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, body, fragments, metadata FROM messages WHERE session_id = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_id, before if before is not None else 2 ** 62, limit)
+            ).fetchall()
+            messages = [self._expand(*row) for row in reversed(rows)]
+        return messages
+
+    def clear(self, session_id: str):
+        """Delete the session's messages, and any fragments no other message references."""
+        with self._lock:
+            rows = self._conn.execute("SELECT fragments FROM messages WHERE session_id = ?", (session_id,))
+            counts = Counter(fid for (ids,) in rows for fid in ids.split(",") if fid)
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.executemany("UPDATE fragments SET refs = refs - ? WHERE id = ?", [(n, fid) for fid, n in counts.items()])
+            self._conn.executemany("DELETE FROM fragments WHERE id = ? AND refs <= 0", [(fid,) for fid in counts])
+            self._conn.commit()
+            for fid in counts:
+                self._fragments.pop(fid, None)
+
+    def _expand(self, seq, role, body, fragments, metadata) -> dict:
+        content = body + "".join(self._fragment(fid) for fid in fragments.split(",") if fid)
+        message = {"role": role, "content": content, "seq": seq}
+        if metadata:
+            message["metadata"] = json.loads(metadata)
+        return message
+
+    def _fragment(self, fid: str) -> str:
+        text = self._fragments.get(fid)
+        if text is None:
+            (text,) = self._conn.execute("SELECT text FROM fragments WHERE id = ?", (fid,)).fetchone()
+            self._fragments[fid] = text
+            if len(self._fragments) > FRAGMENT_CACHE_SIZE:
+                self._fragments.popitem(last=False)
+        else:
+            self._fragments.move_to_end(fid)
+        return text
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Return the process-wide session store selected by SESSION_STORE."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SQLiteSessionStore() if SESSION_STORE == "sqlite" else MemorySessionStore()
+        return _default_store
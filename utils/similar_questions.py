@@ -0,0 +1,318 @@
+"""
+Similar Questions - MinHash/LSH index that maps reworded questions onto cached answers
+
+Questions are compared only within their (query_type, compounds) bucket, after
+removing what the classifier already resolved: compound names, the query type's
+intent phrases and filler words. "How much BPC 157 should I take" and
+"BPC-157 dose?" both reduce to nothing and share one answer. "BPC-157 dosage
+for women" keeps "women" and does not match them.
+
+Numbers (with their units) are never compared approximately: they are part of
+the bucket, so "Is 100mg safe?" can only match questions about exactly 100 mg.
+"""
+import random
+import re
+import threading
+import zlib
+from array import array
+from typing import Optional
+from config import SIMILAR_QUESTIONS_ENABLED, SIMILAR_QUESTIONS_THRESHOLD, SIMILAR_QUESTIONS_MAX_ENTRIES
+from utils.answer_cache import normalize_question
+from utils.query_classifier import QUERY_PATTERNS, find_compounds
+
+PERMUTATIONS = 32
+BANDS = 8  # 4 rows per band: pairs above ~0.6 similarity nearly always share a band
+ROWS = PERMUTATIONS // BANDS
+KEY_BYTES = 32  # Cache keys are sha256 hex digests, stored as raw bytes
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = 0xFFFFFFFF
+_rng = random.Random(1157)
+_PERMUTATION_PARAMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(PERMUTATIONS)]
+
+FILLER_WORDS = frozenset(
+    "a an the is are am was were be been what whats which how do does did i im me my we our you your "
+    "should can could would will to of for in on at with and or it its this that there any some "
+    "take taking use using used about tell please know need want get".split()
+)
+# Number followed by a unit word is one term: "100 mg" and "100mg" are the same dose
+UNITS = frozenset(
+    "mg mcg ug g iu ml cc unit lb kg oz day week month year hour minute min hr wk x time".split()
+)
+# Frequency phrasings share one token; a plain dose question means the daily dose
+FREQUENCIES = [
+    (re.compile(r"\b(?:per|a|each|every|once a) day\b|\bdaily\b"), " daily "),
+    (re.compile(r"\b(?:per|a|each|every|once a) week\b|\bweekly\b"), " weekly "),
+    (re.compile(r"\b(?:per|a|each|every|once a) month\b|\bmonthly\b"), " monthly "),
+]
+DEFAULT_FREQUENCY = {"dosage": "daily"}
+_DECIMAL = re.compile(r"(\d)[.,](\d)")
+_INTENT_PATTERNS = {
+    query_type: re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+    for query_type, patterns in QUERY_PATTERNS.items()
+}
+
+
+def _singular(token: str) -> str:
+    if len(token) > 2 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def question_terms(query_type: str, question: str) -> tuple[list[str], tuple]:
+    """
+    Split a question into the words compared approximately and the numbers
+    compared exactly, once compounds, intent phrases and filler are removed.
+    """
+    text = normalize_question(_DECIMAL.sub(r"\1_\2", question))
+    for _, start, end in reversed(find_compounds(text)):
+        text = text[:start] + " " + text[end:]
+
+    words = []
+    numbers = []
+    raw = text.split()
+    i = 0
+    while i < len(raw):
+        token = raw[i]
+        if any(ch.isdigit() for ch in token):
+            unit = _singular(raw[i + 1]) if i + 1 < len(raw) else ""
+            if token.replace("_", "").isdigit() and unit in UNITS:
+                token += unit
+                i += 1
+            numbers.append(_singular(token))
+        else:
+            words.append(token)
+        i += 1
+
+    text = " ".join(words)
+    for pattern, canonical in FREQUENCIES:
+        text = pattern.sub(canonical, text)
+    intent = _INTENT_PATTERNS.get(query_type)
+    if intent is not None:
+        text = intent.sub(" ", text)
+    default_frequency = DEFAULT_FREQUENCY.get(query_type)
+    tokens = []
+    for token in text.split():
+        if token in FILLER_WORDS or token == default_frequency:
+            continue
+        tokens.append(_singular(token) if len(token) > 3 else token)
+    return tokens, tuple(sorted(numbers))
+
+
+def residual_tokens(query_type: str, question: str) -> list[str]:
+    """Words of the question left once compounds, numbers, intent phrases and filler are removed."""
+    return question_terms(query_type, question)[0]
+
+
+def shingles(tokens: list[str]) -> set:
+    """Character trigrams of each padded token, so plurals and typos still overlap."""
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def signature(grams: set) -> list[int]:
+    """MinHash signature; a question with nothing left has the all-max signature."""
+    if not grams:
+        return [_MAX_HASH] * PERMUTATIONS
+    hashes = [zlib.crc32(gram.encode("utf-8")) for gram in grams]
+    return [min((a * x + b) % _PRIME for x in hashes) & _MAX_HASH for a, b in _PERMUTATION_PARAMS]
+
+
+class _BandTable:
+    """
+    Open-addressing map from a band hash to one slot, packed into a single array.
+
+    Each cell holds a 31-bit fingerprint of the band hash and the slot + 1; 0 is
+    empty and -1 a deleted cell. Fingerprint collisions are harmless because
+    every candidate slot is verified against its signature.
+    """
+
+    EMPTY = 0
+    DELETED = -1
+
+    def __init__(self, size: int = 1024):
+        self._cells = array("q", bytes(8 * size))
+        self._used = 0  # Occupied and deleted cells
+
+    def __len__(self):
+        return sum(1 for cell in self._cells if cell > 0)
+
+    def _probe(self, fingerprint):
+        """Index of the cell holding this fingerprint, else of the first reusable cell, and whether it was found."""
+        cells = self._cells
+        mask = len(cells) - 1
+        i = fingerprint & mask
+        reusable = -1
+        while True:
+            cell = cells[i]
+            if cell == self.EMPTY:
+                return (i if reusable < 0 else reusable), False
+            if cell == self.DELETED:
+                if reusable < 0:
+                    reusable = i
+            elif cell >> 32 == fingerprint:
+                return i, True
+            i = (i + 1) & mask
+
+    def get(self, band_hash: int) -> Optional[int]:
+        i, found = self._probe(band_hash & 0x7FFFFFFF)
+        return (self._cells[i] & 0xFFFFFFFF) - 1 if found else None
+
+    def set(self, band_hash: int, slot: int):
+        fingerprint = band_hash & 0x7FFFFFFF
+        i, found = self._probe(fingerprint)
+        if not found and self._cells[i] == self.EMPTY:
+            self._used += 1
+        self._cells[i] = (fingerprint << 32) | (slot + 1)
+        if self._used * 2 > len(self._cells):
+            self._resize()
+
+    def discard(self, band_hash: int, slot: int):
+        """Remove the entry if it still points at `slot`."""
+        i, found = self._probe(band_hash & 0x7FFFFFFF)
+        if found and (self._cells[i] & 0xFFFFFFFF) - 1 == slot:
+            self._cells[i] = self.DELETED
+
+    def _resize(self):
+        live = [cell for cell in self._cells if cell > 0]
+        size = len(self._cells)
+        while len(live) * 4 > size:
+            size *= 2
+        self._cells = array("q", bytes(8 * size))
+        self._used = 0
+        mask = size - 1
+        for cell in live:
+            i = (cell >> 32) & mask
+            while self._cells[i] != self.EMPTY:
+                i = (i + 1) & mask
+            self._cells[i] = cell
+            self._used += 1
+
+    def clear(self):
+        self.__init__()
+
+
+class SimilarQuestionIndex:
+    """
+    Finds the cache key of an earlier question close enough to a new one.
+
+    Storage is flat, about 300 bytes per question, so millions fit in memory.
+    Signatures sit in one array, cache keys in one bytearray and bucket ids in
+    another array. Each LSH band maps its hash to a single slot in a packed
+    table: the most recent question with that band. Candidates are verified by
+    the fraction of matching MinHash values. When full, the oldest slots are
+    overwritten.
+    """
+
+    def __init__(self, threshold: float = SIMILAR_QUESTIONS_THRESHOLD, max_entries: int = SIMILAR_QUESTIONS_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._signatures = array("I")
+        self._keys = bytearray()
+        self._bucket_of = array("I")
+        self._buckets = {}  # (query_type, compounds, numbers) -> bucket id
+        self._bands = _BandTable()
+        self._next = 0  # Next slot to overwrite once full
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._bucket_of)
+
+    def _bucket(self, query_type, compounds, numbers):
+        bucket = (query_type, tuple(sorted(compounds)), numbers)
+        bucket_id = self._buckets.get(bucket)
+        if bucket_id is None:
+            bucket_id = self._buckets[bucket] = len(self._buckets)
+        return bucket_id
+
+    @staticmethod
+    def _band_hashes(bucket_id, values):
+        return [hash((bucket_id, band, tuple(values[band * ROWS:(band + 1) * ROWS]))) for band in range(BANDS)]
+
+    def _similarity(self, slot, values):
+        stored = self._signatures[slot * PERMUTATIONS:(slot + 1) * PERMUTATIONS]
+        return sum(a == b for a, b in zip(stored, values)) / PERMUTATIONS
+
+    def _signature_of(self, query_type, question):
+        """MinHash signature of the question's words, and its numbers."""
+        tokens, numbers = question_terms(query_type, question)
+        return signature(shingles(tokens)), numbers
+
+    def lookup(self, query_type: str, compounds: list[str], question: str) -> Optional[str]:
+        """Cache key of the most similar earlier question at or above the threshold, or None."""
+        values, numbers = self._signature_of(query_type, question)
+        with self._lock:
+            bucket_id = self._buckets.get((query_type, tuple(sorted(compounds)), numbers))
+            if bucket_id is None:
+                return None
+            best_slot, best = None, self.threshold
+            for band_hash in self._band_hashes(bucket_id, values):
+                slot = self._bands.get(band_hash)
+                if slot is None or self._bucket_of[slot] != bucket_id:
+                    continue
+                similarity = self._similarity(slot, values)
+                if similarity >= best:
+                    best_slot, best = slot, similarity
+            if best_slot is None:
+                return None
+            return self._keys[best_slot * KEY_BYTES:(best_slot + 1) * KEY_BYTES].hex()
+
+    def add(self, query_type: str, compounds: list[str], question: str, cache_key: str):
+        """Index a question under the cache key its answer is stored at."""
+        values, numbers = self._signature_of(query_type, question)
+        key = bytes.fromhex(cache_key)
+        with self._lock:
+            bucket_id = self._bucket(query_type, compounds, numbers)
+            band_hashes = self._band_hashes(bucket_id, values)
+            for band_hash in band_hashes:
+                slot = self._bands.get(band_hash)
+                if slot is not None and self._keys[slot * KEY_BYTES:(slot + 1) * KEY_BYTES] == key \
+                        and self._similarity(slot, values) == 1.0:
+                    return  # Already indexed
+            if len(self._bucket_of) < self.max_entries:
+                slot = len(self._bucket_of)
+                self._signatures.extend(values)
+                self._keys += key
+                self._bucket_of.append(bucket_id)
+            else:
+                slot = self._next
+                self._next = (slot + 1) % self.max_entries
+                self._forget(slot)
+                self._signatures[slot * PERMUTATIONS:(slot + 1) * PERMUTATIONS] = array("I", values)
+                self._keys[slot * KEY_BYTES:(slot + 1) * KEY_BYTES] = key
+                self._bucket_of[slot] = bucket_id
+            for band_hash in band_hashes:
+                self._bands.set(band_hash, slot)
+
+    def _forget(self, slot):
+        """Drop the band entries that still point at a slot about to be reused."""
+        stored = self._signatures[slot * PERMUTATIONS:(slot + 1) * PERMUTATIONS]
+        for band_hash in self._band_hashes(self._bucket_of[slot], stored):
+            self._bands.discard(band_hash, slot)
+
+    def clear(self):
+        with self._lock:
+            self._signatures = array("I")
+            self._keys = bytearray()
+            self._bucket_of = array("I")
+            self._buckets.clear()
+            self._bands.clear()
+            self._next = 0
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_similar_index():
+    """Return the process-wide similar-question index, or None when it is disabled."""
+    global _default_index
+    if not SIMILAR_QUESTIONS_ENABLED:
+        return None
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = SimilarQuestionIndex()
+        return _default_index
@@ -0,0 +1,87 @@
+"""
+Single-flight - Share one upstream call between concurrent identical requests
+"""
+import contextvars
+import threading
+
+
+class _Flight:
+    """Chunks produced so far by one in-flight call, plus how it ended."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent generators that share a key.
+
+    The first caller for a key starts the generator on a background thread; every
+    caller, including the first, replays the chunks from the start and then
+    follows along as new ones arrive. Because the producer does not depend on any
+    one consumer, a caller that stops reading early never stalls the others.
+
+    The producer runs in a copy of the first caller's context, so the shared
+    call is scheduled with that caller's request class and session. Later
+    callers join it as it is: they are only waiting on a call already queued
+    or in flight, and sending another would double the upstream cost.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stream(self, key, factory):
+        """Yield the chunks of factory()'s generator and return its return value."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+        if leader:
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(self._produce, key, flight, factory), daemon=True).start()
+        return (yield from self._follow(flight))
+
+    def _produce(self, key, flight, factory):
+        def forward():
+            flight.result = yield from factory()
+
+        try:
+            for chunk in forward():
+                with flight.cond:
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _follow(self, flight):
+        index = 0
+        while True:
+            with flight.cond:
+                while index >= len(flight.chunks) and not flight.done:
+                    flight.cond.wait()
+                pending = flight.chunks[index:]
+                finished = flight.done
+            index += len(pending)
+            yield from pending
+            if finished:
+                break
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
@@ -0,0 +1,52 @@
+"""
+Stream Renderer - Throttled incremental rendering of streamed answers
+"""
+import time
+from config import RENDER_INTERVAL_SECONDS, RENDER_MAX_PENDING_CHARS
+
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    """
+    Buffers streamed chunks and re-renders a placeholder at most once per frame.
+
+    A frame is rendered when `interval` seconds have passed since the last one or
+    when `max_pending` characters have arrived since then, whichever comes first.
+    """
+
+    def __init__(self, placeholder, interval: float = RENDER_INTERVAL_SECONDS, max_pending: int = RENDER_MAX_PENDING_CHARS):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_pending = max_pending
+        self.parts = []
+        self.pending = 0
+        self.last_render = 0.0
+        self.frames = 0
+        self.render_seconds = 0.0
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def append(self, chunk: str):
+        self.parts.append(chunk)
+        self.pending += len(chunk)
+        now = time.monotonic()
+        if now - self.last_render >= self.interval or self.pending >= self.max_pending:
+            self._render(self.text + CURSOR, now)
+
+    def finish(self, text: str = None) -> str:
+        """Render the final text without the cursor and return it."""
+        if text is not None:
+            self.parts = [text]
+        final = self.text
+        self._render(final, time.monotonic())
+        return final
+
+    def _render(self, content: str, now: float):
+        self.placeholder.markdown(content)
+        self.pending = 0
+        self.last_render = time.monotonic()
+        self.render_seconds += self.last_render - now
+        self.frames += 1
@@ -0,0 +1,208 @@
+"""
+Cache Warm-up - Pre-generates the Quick Lookup matrix into a versioned snapshot
+
+Usage (e.g. from cron):
+    python -m utils.warmup --concurrency 2
+
+The app pins the snapshot's answers in the answer cache at startup, so Quick
+Lookup clicks never reach the API while the snapshot is fresh. With
+WARMUP_ENABLED the app also refreshes entries in the background before they
+expire.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    COMPOUND_CATEGORIES, QUICK_LOOKUP_BUTTONS, RESPONSE_TARGETS, PERPLEXITY_MODEL, ANSWER_CACHE_TTL,
+    WARMUP_ENABLED, WARMUP_SNAPSHOT_PATH, WARMUP_CONCURRENCY, WARMUP_RATE_RESERVE,
+    WARMUP_REFRESH_AHEAD, WARMUP_INTERVAL
+)
+from utils.prompts import PROMPTS
+from utils.query_classifier import classify_query
+from utils.scheduler import request_class
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def quick_lookup_questions() -> list[str]:
+    """Every question the Quick Lookup buttons can send, in matrix order."""
+    return [
+        template.format(compound=compound)
+        for category in COMPOUND_CATEGORIES.values()
+        for compound in category
+        for _, template in QUICK_LOOKUP_BUTTONS
+    ]
+
+
+def snapshot_version() -> str:
+    """Changes whenever the model, prompts, targets or buttons change, invalidating old snapshots."""
+    prompt_versions = {name: PROMPTS.version(name) for name in PROMPTS.templates}
+    raw = json.dumps([PERPLEXITY_MODEL, prompt_versions, RESPONSE_TARGETS, QUICK_LOOKUP_BUTTONS], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def load_snapshot(cache, path: str = WARMUP_SNAPSHOT_PATH, ttl: float = ANSWER_CACHE_TTL, similar=None) -> int:
+    """Pin a snapshot's unexpired answers in the cache (and index their questions); returns how many were pinned."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return 0
+    if snapshot.get("version") != snapshot_version():
+        logger.info("Ignoring warm-up snapshot %s from an older prompt version", path)
+        return 0
+    now = time.time()
+    pinned = 0
+    for entry in snapshot["entries"]:
+        if now - entry["created_at"] <= ttl:
+            cache.pin(entry["key"], {k: entry[k] for k in ("content", "citations", "created_at")})
+            if similar is not None:
+                similar.add(entry["query_type"], entry["compounds"], entry["question"], entry["key"])
+            pinned += 1
+    return pinned
+
+
+def save_snapshot(entries: list[dict], path: str = WARMUP_SNAPSHOT_PATH):
+    """Write the snapshot atomically so readers never see a partial file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    snapshot = {"version": snapshot_version(), "model": PERPLEXITY_MODEL, "created_at": time.time(), "entries": entries}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def wait_for_headroom(rate_limiter, reserve: float = WARMUP_RATE_RESERVE):
+    """Hold warm-up requests back while the shared limiter is low, so user requests go first."""
+    # A small per-process share of the quota may hold fewer tokens than the reserve
+    while rate_limiter is not None and rate_limiter.available() < min(reserve + 1, rate_limiter.capacity):
+        time.sleep(1.0 / rate_limiter.rate)
+
+
+def warm_quick_lookup(client, cache, concurrency: int = WARMUP_CONCURRENCY, refresh_ahead: float = WARMUP_REFRESH_AHEAD,
+                      ttl: float = ANSWER_CACHE_TTL, path: str = WARMUP_SNAPSHOT_PATH) -> dict:
+    """
+    Make sure every Quick Lookup answer is cached, pinned and not about to expire.
+
+    Answers already cached with more than `refresh_ahead` seconds left are only
+    pinned; the rest are regenerated upstream, at most `concurrency` at a time.
+    Writes the snapshot and returns counts of fresh, generated and failed entries.
+    """
+    started = time.perf_counter()
+    counts = {"fresh": 0, "generated": 0, "failed": 0}
+    entries = {}
+    stale = []
+    now = time.time()
+    for question in quick_lookup_questions():
+        query_type, compounds, _ = classify_query(question)
+        key = client.cache_key(query_type, compounds, question)
+        entry = cache.get(key)
+        record = {"key": key, "question": question, "query_type": query_type, "compounds": compounds}
+        if entry is not None and now - entry["created_at"] < ttl - refresh_ahead:
+            cache.pin(key, entry)
+            if client.similar is not None:
+                client.similar.add(query_type, compounds, question, key)
+            entries[key] = {**record, **entry}
+            counts["fresh"] += 1
+        else:
+            stale.append(record)
+
+    def generate(record):
+        wait_for_headroom(client.rate_limiter)
+        try:
+            with request_class("background", "warmup"):
+                result = client.refresh_answer(record["question"], record["query_type"], record["compounds"])
+        except Exception as e:
+            logger.warning("Warm-up failed for %r: %s", record["question"], e)
+            return record, None
+        return record, {"content": result["content"], "citations": result["citations"], "created_at": time.time()}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for record, entry in pool.map(generate, stale):
+            if entry is None or not entry["content"]:
+                counts["failed"] += 1
+                continue
+            cache.pin(record["key"], entry)
+            entries[record["key"]] = {**record, **entry}
+            counts["generated"] += 1
+
+    save_snapshot(list(entries.values()), path)
+    for result, count in counts.items():
+        metrics.inc("warmup_entries_total", count, result=result)
+    metrics.observe("stage_seconds", time.perf_counter() - started, stage="warmup")
+    logger.info("Quick Lookup warm-up: %(fresh)d fresh, %(generated)d generated, %(failed)d failed", counts)
+    return counts
+
+
+def start_warmup(client, cache, refresh: bool = WARMUP_ENABLED, interval: float = WARMUP_INTERVAL,
+                 path: str = WARMUP_SNAPSHOT_PATH):
+    """
+    Pin the current snapshot, then keep it current from a daemon thread.
+
+    With `refresh` the thread regenerates entries nearing expiry every
+    `interval` seconds; otherwise it only re-pins the snapshot when an
+    external job (cron) rewrites it.
+    """
+    load_snapshot(cache, path, similar=client.similar)
+
+    def run():
+        loaded_mtime = _mtime(path)
+        while True:
+            if refresh:
+                try:
+                    warm_quick_lookup(client, cache, path=path)
+                except Exception:
+                    logger.exception("Quick Lookup warm-up pass failed")
+            else:
+                mtime = _mtime(path)
+                if mtime != loaded_mtime:
+                    load_snapshot(cache, path, similar=client.similar)
+                    loaded_mtime = mtime
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    from utils.perplexity_client import get_client
+
+    parser = argparse.ArgumentParser(description="Pre-generate the Quick Lookup matrix into the answer cache.")
+    parser.add_argument("--concurrency", type=int, default=WARMUP_CONCURRENCY, help="Maximum upstream calls in flight")
+    parser.add_argument("--snapshot", default=WARMUP_SNAPSHOT_PATH, help="Snapshot file to write")
+    args = parser.parse_args(argv)
+
+    client = get_client()
+    if client.cache is None:
+        print("ANSWER_CACHE_ENABLED is false; nothing to warm.", file=sys.stderr)
+        return 1
+    load_snapshot(client.cache, args.snapshot)
+    counts = warm_quick_lookup(client, client.cache, args.concurrency, path=args.snapshot)
+    print(
+        f"{counts['fresh']} fresh, {counts['generated']} generated, {counts['failed']} failed "
+        f"of {len(quick_lookup_questions())} Quick Lookup answers",
+        file=sys.stderr
+    )
+    return 0 if not counts["failed"] else 2
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())